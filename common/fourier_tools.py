@@ -1,3 +1,10 @@
+import contextlib
+import functools
+from eddies.common import instrumentation
+
+#- FFT backend used by fft2 and rfft2, see set_fft_backend
+_fft_backend = {'name': 'numpy', 'workers': None}
+
 def get_wavenumbers(n):
     """
     Description:
@@ -14,11 +21,219 @@ def get_wavenumbers(n):
     
     #- Parameter
     k = np.arange(0, n)
-
+    
     #- Calculate Wavenumbers
     if n%2 == 0: # Even
         k[-(n//2)+1:] = - np.flip(k[1:(n//2)]) # NF sits in the middle (see np.fft.fft()?)
     else: # Odd
         k[-(n//2):] = - np.flip(k[1:(n//2)+1])
+    
+    return k
+
+def set_fft_backend(name='numpy', workers=None):
+    """
+    Description:
+        Sets the backend of all FFTs computed by fft2 and rfft2 of this module (e.g. for spectra.get_2D_spectrum).
+        Backends:
+            numpy: np.fft, single-threaded
+            scipy: scipy.fft with 'workers' threads. Plans of repeated shapes are cached by scipy.
+            pyfftw: pyFFTW with 'workers' threads, if it is installed. Plans of repeated shapes are kept in 
+                pyFFTW's cache, they can be saved and reused across sessions by export_wisdom and import_wisdom.
+    Parameters:
+        name (str): Backend (numpy, scipy, pyfftw) (Defaults: numpy)
+        workers (int): Number of threads, -1 uses all cores (Defaults: None, i.e. one thread)
+    """
+    #- Exceptions
+    if name not in ('numpy', 'scipy', 'pyfftw'):
+        raise ValueError('Unknown FFT backend ' + str(name) + ', use numpy, scipy or pyfftw')
+    
+    if name == 'pyfftw':
+        import pyfftw.interfaces.cache
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(60)
+    
+    _fft_backend['name']    = name
+    _fft_backend['workers'] = workers
+
+@contextlib.contextmanager
+def fft_backend(name, workers=None):
+    """
+    Description:
+        Context manager using an FFT backend (see set_fft_backend) within its block.
         
-    return k
\ No newline at end of file
+        Example:
+        with fourier_tools.fft_backend('scipy', workers=-1):
+            ske, sd, states = spectra.get_2D_spectrum(u, v, udis, vdis)
+    Parameters:
+        name (str): Backend (numpy, scipy, pyfftw)
+        workers (int): Number of threads, -1 uses all cores (Defaults: None, i.e. one thread)
+    """
+    previous = dict(_fft_backend)
+    set_fft_backend(name, workers)
+    try:
+        yield
+    finally:
+        _fft_backend.update(previous)
+
+def _fft_module():
+    """
+    Description:
+        Module of the current FFT backend and its keyword arguments.
+    Returns:
+        module, kwargs
+    """
+    name    = _fft_backend['name']
+    workers = _fft_backend['workers']
+    
+    if name == 'scipy':
+        import scipy.fft
+        return scipy.fft, {'workers': workers}
+    
+    if name == 'pyfftw':
+        import pyfftw.interfaces.scipy_fft
+        return pyfftw.interfaces.scipy_fft, {'workers': workers}
+    
+    import numpy as np
+    return np.fft, {}
+
+@instrumentation.instrumented('fft')
+def fft2(a, axes=(-2, -1)):
+    """
+    Description:
+        2D-Fourier Transformation along the given axes with the current FFT backend (see np.fft.fft2).
+    Parameters:
+        a (np.array): Input
+        axes (tuple): Axes to transform (Defaults: (-2, -1))
+    Returns:
+        (np.array): Complex Fourier coefficients, same shape as a
+    """
+    module, kwargs = _fft_module()
+    
+    return module.fft2(a, axes=axes, **kwargs)
+
+@instrumentation.instrumented('fft')
+def rfft2(a, axes=(-2, -1)):
+    """
+    Description:
+        2D-Fourier Transformation of real input along the given axes with the current FFT backend (see np.fft.rfft2).
+        Only non-negative wavenumbers of the last axis in axes are returned.
+    Parameters:
+        a (np.array): Real input
+        axes (tuple): Axes to transform (Defaults: (-2, -1))
+    Returns:
+        (np.array): Complex Fourier coefficients, shape of a with n//2+1 along the last axis in axes
+    """
+    module, kwargs = _fft_module()
+    
+    return module.rfft2(a, axes=axes, **kwargs)
+
+def export_wisdom(filename):
+    """
+    Description:
+        Saves the plans (wisdom) of pyFFTW to a file, such that later sessions can reuse them.
+    Parameters:
+        filename (str): File to save the wisdom to
+    """
+    #- Modules
+    import pickle
+    import pyfftw
+    
+    with open(filename, 'wb') as f:
+        pickle.dump(pyfftw.export_wisdom(), f)
+
+def import_wisdom(filename):
+    """
+    Description:
+        Loads plans (wisdom) of pyFFTW saved by export_wisdom.
+    Parameters:
+        filename (str): File with the saved wisdom
+    """
+    #- Modules
+    import pickle
+    import pyfftw
+    
+    with open(filename, 'rb') as f:
+        pyfftw.import_wisdom(pickle.load(f))
+
+def taper_window(ny, nx, kind='hann', alpha=0.5, normalize=False):
+    """
+    Description:
+        Separable 2D taper window applied before the 2D-Fourier Transformation. Windows are cached per
+        (ny, nx, kind, alpha, normalize) and returned read-only, so repeated spectra of the same grid reuse them.
+        Kinds:
+            hann: Hanning window in both directions (np.hanning, as interpolation_tools.apply_hanning_window)
+            tukey: Tukey window with taper fraction alpha in both directions (scipy.signal.windows.tukey)
+            none: No tapering
+    Parameters:
+        ny, nx (int): Number of meridional and zonal gridpoints
+        kind (str): Kind of window (hann, tukey, none) (Defaults: hann)
+        alpha (float): Fraction of the tukey window inside the cosine taper (Defaults: 0.5)
+        normalize (bool): Scale the window to a mean square of 1, which restores the variance of the 
+            tapered quantity (Defaults: False)
+    Returns:
+        (np.array): Window, shape:(ny, nx)
+    """
+    return _taper_window(int(ny), int(nx), kind, float(alpha), bool(normalize))
+
+@instrumentation.instrumented('window')
+def apply_taper(u, kind='hann', alpha=0.5, normalize=False, out=None):
+    """
+    Description:
+        Multiplies a taper window (see taper_window) along the meridional and zonal axes (-3, -2) of u.
+        With out=u the window is applied in place without allocating a new array.
+    Parameters:
+        u (np.array): Quantity in matrix form, shape:(..., ny, nx, nz)
+        kind (str): Kind of window (hann, tukey, none) (Defaults: hann)
+        alpha (float): Fraction of the tukey window inside the cosine taper (Defaults: 0.5)
+        normalize (bool): Restore the variance of the tapered quantity (Defaults: False)
+        out (np.array): Array to write the result to, e.g. u (Defaults: None, i.e. a new array)
+    Returns:
+        (np.array): Tapered quantity, shape:(..., ny, nx, nz)
+    """
+    #- Modules
+    import numpy as np
+    
+    window = taper_window(u.shape[-3], u.shape[-2], kind, alpha, normalize)
+    
+    return np.multiply(u, window[:, :, np.newaxis], out=out)
+
+@functools.lru_cache(maxsize=None)
+def _taper_window(ny, nx, kind, alpha, normalize):
+    """Cached window of taper_window"""
+    #- Modules
+    import numpy as np
+    
+    window = np.outer(window_1D(ny, kind, alpha), window_1D(nx, kind, alpha))
+    if normalize == True:
+        window = window / np.sqrt(np.mean(window ** 2))
+    window.flags.writeable = False
+    
+    return window
+
+@functools.lru_cache(maxsize=None)
+def window_1D(n, kind='hann', alpha=0.5):
+    """
+    Description:
+        Cached 1D window of taper_window, returned read-only.
+    Parameters:
+        n (int): Number of gridpoints
+        kind (str): Kind of window (hann, tukey, none) (Defaults: hann)
+        alpha (float): Fraction of the tukey window inside the cosine taper (Defaults: 0.5)
+    Returns:
+        (np.array): Window, shape:(n,)
+    """
+    #- Modules
+    import numpy as np
+    
+    if kind == 'hann':
+        window = np.hanning(n)
+    elif kind == 'tukey':
+        from scipy.signal import windows
+        window = windows.tukey(n, alpha)
+    elif kind == 'none':
+        window = np.ones(n)
+    else:
+        raise ValueError('Unknown taper window ' + str(kind) + ', use hann, tukey or none')
+    window.flags.writeable = False
+    
+    return window
@@ -0,0 +1,212 @@
+import time
+import functools
+import contextlib
+
+#- Settings of the instrumentation, see configure
+_config = {'enabled': False, 'callback': None, 'trace_memory': False, 'tracing': False}
+
+#- Records of the finished stages and stack of the running stages
+_records = []
+_running = []
+
+def configure(enabled=True, callback=None, trace_memory=False):
+    """
+    Description:
+        Turns the instrumentation of the stages (load, interpolate, fill, window, fft, collapse, energetics, save)
+        on or off. It is off by default and then costs a single check per call. Each finished stage is recorded
+        with its wall time, CPU time, peak RSS of the process and bytes processed, logged at DEBUG level to the
+        logger 'eddies.instrumentation' and passed to the callback. Stages of worker processes are not recorded.
+        
+        Example:
+        instrumentation.configure(trace_memory=True)
+        energy_ratios, spectra = sweep.run_sweep(...)
+        instrumentation.report('../resources/reports/sweep.json')
+    Parameters:
+        enabled (bool): Whether stages are recorded (Defaults: True)
+        callback (callable): Called with the record (dict) of each finished stage (Defaults: None)
+        trace_memory (bool): Also record the peak of memory allocated by Python and numpy within each stage
+            by tracemalloc, which slows down allocations (Defaults: False)
+    """
+    #- Modules
+    import tracemalloc
+    
+    _config['enabled']      = enabled
+    _config['callback']     = callback
+    _config['trace_memory'] = trace_memory and enabled
+    
+    if _config['trace_memory'] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _config['tracing'] = True
+    elif not _config['trace_memory'] and _config['tracing']:
+        tracemalloc.stop() # Only if it was started here
+        _config['tracing'] = False
+
+@contextlib.contextmanager
+def stage(name, nbytes=None, **info):
+    """
+    Description:
+        Context manager recording a stage (see configure). Stages can be nested, the record of a stage includes
+        the time of its nested stages. The record can be extended within the block, e.g. by bytes processed.
+        
+        Example:
+        with instrumentation.stage('fft', nbytes=u.nbytes) as record:
+            fu = fourier_tools.rfft2(u)
+    Parameters:
+        name (str): Name of the stage
+        nbytes (int): Bytes processed by the stage (Defaults: None)
+        info: Further values to record, e.g. method or shape
+    Yields:
+        record (dict): Record of the stage, None if the instrumentation is off
+    """
+    if not _config['enabled']:
+        yield None
+        return
+    
+    #- Modules
+    import tracemalloc
+    
+    record = {'stage': name, 'parent': _running[-1]['stage'] if _running else None, 'bytes': nbytes}
+    record.update(info)
+    frame  = {'stage': name, 'peak': 0}
+    
+    if _config['trace_memory']:
+        current, peak = tracemalloc.get_traced_memory()
+        for outer in _running:
+            outer['peak'] = max(outer['peak'], peak) # Kept before the peak is reset for this stage
+        tracemalloc.reset_peak()
+        frame['start_memory'] = current
+    
+    _running.append(frame)
+    wall = time.perf_counter()
+    cpu  = time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_time'] = time.perf_counter() - wall
+        record['cpu_time']  = time.process_time() - cpu
+        record['peak_rss']  = _peak_rss()
+        _running.pop()
+        
+        if _config['trace_memory']:
+            peak                  = max(tracemalloc.get_traced_memory()[1], frame['peak'])
+            record['peak_traced'] = peak - frame['start_memory']
+            for outer in _running:
+                outer['peak'] = max(outer['peak'], peak)
+        
+        _records.append(record)
+        _emit(record)
+
+def instrumented(name, nbytes=True):
+    """
+    Description:
+        Decorator recording each call of a function as a stage (see stage). Calls within a stage of the same
+        name (e.g. InterpolationPlan.apply within interpolate_to_grid) are part of that stage.
+    Parameters:
+        name (str): Name of the stage
+        nbytes (bool): Record the bytes of the array arguments as bytes processed (Defaults: True)
+    Returns:
+        decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _config['enabled'] or (_running and _running[-1]['stage'] == name):
+                return func(*args, **kwargs)
+            
+            size = _nbytes(list(args) + list(kwargs.values())) if nbytes else None
+            with stage(name, nbytes=size, function=func.__module__ + '.' + func.__qualname__):
+                return func(*args, **kwargs)
+        
+        return wrapper
+    
+    return decorator
+
+def records():
+    """
+    Description:
+        Records of all finished stages since the last reset.
+    Returns:
+        (list): Records (dict) in the order the stages finished
+    """
+    return list(_records)
+
+def summary():
+    """
+    Description:
+        Totals of the recorded stages by name. Nested stages are counted in their parents as well.
+    Returns:
+        (dict): count, wall_time, cpu_time, bytes and peak memory by name of the stage
+    """
+    totals = {}
+    for record in _records:
+        total = totals.setdefault(record['stage'], {'count': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'bytes': 0,
+                                                    'peak_rss': 0, 'peak_traced': None})
+        total['count']     += 1
+        total['wall_time'] += record['wall_time']
+        total['cpu_time']  += record['cpu_time']
+        total['bytes']     += record['bytes'] or 0
+        total['peak_rss']   = max(total['peak_rss'], record['peak_rss'] or 0)
+        if 'peak_traced' in record:
+            total['peak_traced'] = max(total['peak_traced'] or 0, record['peak_traced'])
+    
+    return totals
+
+def report(filename=None):
+    """
+    Description:
+        Report of the run with the summary and all records, optionally saved as JSON.
+    Parameters:
+        filename (str): File to save the report to (Defaults: None, i.e. not saved)
+    Returns:
+        (dict): 'summary' and 'records'
+    """
+    #- Modules
+    import json
+    
+    result = {'summary': summary(), 'records': records()}
+    
+    if filename is not None:
+        with open(filename, 'w') as f:
+            json.dump(result, f, indent=1, default=str)
+    
+    return result
+
+def reset():
+    """
+    Description:
+        Removes all records, e.g. before a new run.
+    """
+    _records.clear()
+
+def _emit(record):
+    """Logs a record and passes it to the callback"""
+    #- Modules
+    import logging
+    
+    logger = logging.getLogger('eddies.instrumentation')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('{stage}: {wall_time:.3f} s wall, {cpu_time:.3f} s CPU, {bytes} bytes'.format(**record))
+    
+    if _config['callback'] is not None:
+        _config['callback'](record)
+
+def _nbytes(values):
+    """Bytes of all arrays among values"""
+    size = 0
+    for value in values:
+        if hasattr(value, 'nbytes') and hasattr(value, 'shape'):
+            size = size + int(value.nbytes)
+    
+    return size
+
+def _peak_rss():
+    """Peak resident set size of the process in bytes, None where the resource module is not available"""
+    try:
+        import sys
+        import resource
+    except ImportError:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    return peak if sys.platform == 'darwin' else peak * 1024 # Bytes on macOS, kilobytes on Linux
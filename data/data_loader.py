@@ -1,24 +1,127 @@
+from eddies.common import instrumentation
+
 #----------------------
 # Import modules for this package
 #----------------------
 
-def load_original_data(path, year, model_run):
+def load_original_data(path, year, model_run, days=None, levels=None, fields=('u', 'udis', 'v', 'vdis'), 
+                       chunk_days=None, file_pattern='{field}.{model_run}.{year}.nc', variables=None):
     """
     Description:
-        Loads original datasets of FESOM
+        Loads original datasets of FESOM from netCDF files. Only the selected days and levels of the 
+        selected fields are read from disk. Several years are read as one dataset (MFDataset).
+        With chunk_days, the data is not loaded at once but yielded in chunks of days 
+        (e.g. for streaming.stream_spectra).
     Parameters:
         path (str): Source of the original data. Must end with "/". 
-        year (str): Year of the corresponding FESOM data
+        year (str or list): Year of the corresponding FESOM data, or a list of consecutive years
         model_run (str): Identifier for the datasource
+        days (int, slice or list): Days to load, an int loads the first days as in interpolate_to_grid 
+            (Defaults: None, i.e. all days)
+        levels (int, slice or list): Levels to load, an int loads the first levels as lvls in interpolate_to_grid,
+            a single level is selected by a list, e.g. [lvl] (Defaults: None, i.e. all levels)
+        fields (tuple): Fields to load, in the order they are returned (Defaults: ('u', 'udis', 'v', 'vdis'))
+        chunk_days (int): Number of days in each chunk (Defaults: None, i.e. load all days at once)
+        file_pattern (str): Filename of a field relative to path with placeholders {field}, {model_run} and {year}
+            (Defaults: '{field}.{model_run}.{year}.nc')
+        variables (dict): Name of the netCDF variable of each field (Defaults: None, i.e. the name of the field)
     Returns: 
-        u, udis, v, vdis (np.array): Velocities and dissipation tendency.
+        u, udis, v, vdis (np.array): Velocities and dissipation tendency (or the selected fields), 
+            shape:(days, elem_n, levels). With chunk_days a generator yielding these in chunks of days.
     """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    if isinstance(days, (int, np.integer)):
+        days = slice(0, int(days)) # First days
+    if isinstance(levels, (int, np.integer)):
+        levels = slice(0, int(levels)) # First levels
+    if levels is None:
+        levels = slice(None)
+    
+    datasets = [_open_original_data(path, year, model_run, field, file_pattern) for field in fields]
+    try:
+        var      = [ds.variables[(variables or {}).get(field, field)] for ds, field in zip(datasets, fields)]
+        day_idx  = np.arange(var[0].shape[0])[slice(None) if days is None else days]
+    except BaseException:
+        for ds in datasets:
+            ds.close()
+        raise
+    
+    if chunk_days is None:
+        try:
+            return tuple(_read_days(q, day_idx, levels) for q in var)
+        finally:
+            for ds in datasets:
+                ds.close()
+    
+    return _iter_original_data(datasets, var, day_idx, levels, chunk_days)
 
-    #---
-    # Note: Implement this function such that it load data from your source path.
-    #---
-      
-    return (u, udis, v, vdis)
+def _open_original_data(path, year, model_run, field, file_pattern):
+    """
+    Description:
+        Opens the netCDF file(s) of a field of the original data, several years as one MFDataset.
+    Parameters:
+        See load_original_data
+    Returns:
+        (netCDF4.Dataset or netCDF4.MFDataset)
+    """
+    #- Modules
+    from netCDF4 import Dataset, MFDataset
+    
+    if isinstance(year, (list, tuple)):
+        files = [path + file_pattern.format(field=field, model_run=model_run, year=y) for y in year]
+        return MFDataset(files) # Aggregated along the unlimited time dimension
+    
+    return Dataset(path + file_pattern.format(field=field, model_run=model_run, year=year))
+
+def _iter_original_data(datasets, var, day_idx, levels, chunk_days):
+    """
+    Description:
+        Yields chunks of days of the selected fields and closes the datasets afterwards.
+    Parameters:
+        datasets (list): Opened datasets
+        var (list): netCDF variables of the fields
+        day_idx (np.array): Days to load
+        levels (slice or list): Levels to load
+        chunk_days (int): Number of days in each chunk
+    Yields:
+        (tuple): One chunk of each field, shape:(chunk_days, elem_n, levels)
+    """
+    try:
+        for i in range(0, len(day_idx), chunk_days):
+            yield tuple(_read_days(q, day_idx[i:i + chunk_days], levels) for q in var)
+    finally:
+        for ds in datasets:
+            ds.close()
+
+def _read_days(q, day_idx, levels):
+    """
+    Description:
+        Reads the hyperslab of the given days and levels of a netCDF variable. Consecutive days are read as 
+        one slice. Masked values are set to NaN.
+    Parameters:
+        q (netCDF4.Variable): Variable, shape:(time, elem_n, nz)
+        day_idx (np.array): Days to read
+        levels (slice or list): Levels to read
+    Returns:
+        (np.array): shape:(days, elem_n, levels)
+    """
+    #- Modules
+    import numpy as np
+    
+    if len(day_idx) > 0 and np.all(np.diff(day_idx) == 1):
+        day_idx = slice(int(day_idx[0]), int(day_idx[-1]) + 1)
+    else:
+        day_idx = list(day_idx)
+    
+    with instrumentation.stage('load') as record:
+        days = np.ma.filled(q[day_idx, :, levels], np.nan)
+        if record is not None:
+            record['bytes'] = days.nbytes
+    
+    return days
 
 def load_interpolated_total_energetics(f_dis, f_ke, filled=True):
     """
@@ -57,4 +160,55 @@ def load_interpolated_total_energetics(f_dis, f_ke, filled=True):
             ke_interp[i]  = np.load(folder + f_ke +  '_' + method  + '.npy')
             dis_interp[i] = np.load(folder + f_dis +  '_' + method + '.npy')
         
-    return dis_interp, ke_interp
\ No newline at end of file
+    return dis_interp, ke_interp
+
+def load_total_energetics_from_store(store, scheme, year, dx, dy, sx, sy, is_hw=False, filled=True, lvl=None, **params):
+    """
+    Description: 
+        Load total energetics of interpolated data for each method from a result store (see data_saver with store
+        or sweep.run_sweep) and returns it in one array. Reads the index of the store once instead of reconstructing 
+        filenames.
+    Parameters:
+        store (result_store.ResultStore): Store with the saved total energetics
+        scheme (str): Backscatter scheme
+        year (int): Year of interpolated data
+        dx, dy, sx, sy (float): Target-Grid spacing and starting points of the interpolation
+        is_hw (bool): if a Hanning Window was applied to data (Defaults: False)
+        filled (bool): whether NaN-values of interpolated data was filled at the boarder or not (Defaults:True)
+        lvl (int): Level of total energetics stored for all levels, shape:(nz,) (Defaults: None, i.e. all levels)
+        params: Further parameters to select one result for each method, e.g. lvls, lx, ly or days of run_sweep
+    Output:
+        dis_interp, ke_interp (np.arrays): Total energetics of dissipation or kinetic energy of interpolated data. 
+            Shape=(n_methods,) for a level or results stored as scalars, else shape=(n_methods, nz)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    methods = ['nearest', 'linear', 'cubic']
+    ke      = {}
+    dis     = {}
+    
+    #- Load all methods at once
+    results = store.load_many(quantity='total_energetics', scheme=scheme, year=year, dx=dx, dy=dy, sx=sx, sy=sy, 
+                              hw=is_hw, filled=filled, method=methods, **params)
+    for stored, arrays in results:
+        method = stored['method']
+        if method in ke:
+            raise ValueError('Several total energetics stored for method ' + method + ', select one by further '
+                             'parameters, e.g. lvls, lx, ly or days')
+        ke[method]  = arrays['ke']
+        dis[method] = arrays['dis']
+    
+    #- Exceptions
+    missing = [method for method in methods if method not in ke]
+    if len(missing) > 0:
+        raise KeyError('No total energetics stored for method(s) ' + ', '.join(missing))
+    
+    ke_interp  = np.stack([np.asarray(ke[method], dtype=np.float64) for method in methods])
+    dis_interp = np.stack([np.asarray(dis[method], dtype=np.float64) for method in methods])
+    if lvl is not None and ke_interp.ndim > 1:
+        ke_interp  = ke_interp[:, lvl]
+        dis_interp = dis_interp[:, lvl]
+    
+    return dis_interp, ke_interp
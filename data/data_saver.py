@@ -1,4 +1,11 @@
-def save_interpolated_values(u, udis, v, vdis, year, scheme, dx, dy, sx, sy, folder, method, interp_boarders):
+import logging
+from eddies.common import instrumentation
+
+#- Progress messages, silent unless enabled by logging (e.g. logging.basicConfig(level=logging.INFO))
+logger = logging.getLogger(__name__)
+
+@instrumentation.instrumented('save')
+def save_interpolated_values(u, udis, v, vdis, year, scheme, dx, dy, sx, sy, folder, method, interp_boarders, store=None):
     """
     Description: 
         Saves interpolated values to specified folder at disk.
@@ -10,14 +17,22 @@ def save_interpolated_values(u, udis, v, vdis, year, scheme, dx, dy, sx, sy, fol
         folder (str): Location where to save data
         method (str): Interpolation method
         interp_boarders (bool): If NaN values on the edges are interpolated by nearest neigbours or cut out
+        store (result_store.ResultStore): If given, the values are saved to the store instead of folder (Defaults: None)
     Returns:
     Saved data at disk
-    f1, f2, f3, f4: filenames, type:str
+    f1, f2, f3, f4: filenames, type:str (key of the result in the store, if given)
     """
     
     #- Modules
     import numpy as np
     
+    #- Result store
+    if store is not None:
+        key = store.save({'u': u, 'udis': udis, 'v': v, 'vdis': vdis}, quantity='interpolated', 
+                         scheme=scheme, year=year, dx=dx, dy=dy, sx=sx, sy=sy, method=method, filled=interp_boarders)
+        logger.info('Interpolated values saved to %s', store.folder)
+        return key
+    
     #- Saving
     save = 'y' #input('Want to save (y/n)?')
     if save == 'y':
@@ -45,21 +60,22 @@ def save_interpolated_values(u, udis, v, vdis, year, scheme, dx, dy, sx, sy, fol
         f4 = folder + 'vdis_' + flag
         
         np.save(f1, u)
-        print('u saved to {}'.format(f1))
+        logger.info('u saved to %s', f1)
         np.save(f2, udis)
-        print('udis saved to {}'.format(f2))
+        logger.info('udis saved to %s', f2)
         np.save(f3, v)
-        print('v saved to {}'.format(f3))
+        logger.info('v saved to %s', f3)
         np.save(f4, vdis)
-        print('vdis saved to {}'.format(f4))
+        logger.info('vdis saved to %s', f4)
         
-        print('All data saved')
+        logger.info('All data saved')
         return (f1, f2, f3, f4)
     else:
-        print('No data saved')
+        logger.info('No data saved')
         return(None, None, None, None)
     
-def save_collapsed_spectra(ke, dis, year, scheme, dx, dy, sx, sy, folder, method, is_hw, interp_boarders):
+@instrumentation.instrumented('save')
+def save_collapsed_spectra(ke, dis, year, scheme, dx, dy, sx, sy, folder, method, is_hw, interp_boarders, store=None):
     """
     Description: 
         Saves collapsed spectra to specified folder at disk.
@@ -71,6 +87,8 @@ def save_collapsed_spectra(ke, dis, year, scheme, dx, dy, sx, sy, folder, method
         folder (str): location where to save data
         method (str): interpolation method
         is_hw (bool): if a Hanning Window was applied to data
+        interp_boarders (bool): If NaN values on the edges are interpolated by nearest neigbours or cut out
+        store (result_store.ResultStore): If given, the values are saved to the store instead of folder (Defaults: None)
     Returns:
         Saved data at disk
         f1, f2, f3, f4 (str): filenames
@@ -79,6 +97,13 @@ def save_collapsed_spectra(ke, dis, year, scheme, dx, dy, sx, sy, folder, method
     #- Modules
     import numpy as np
     
+    #- Result store
+    if store is not None:
+        key = store.save({'ke': ke, 'dis': dis}, quantity='collapsed_spectra', scheme=scheme, year=year, 
+                         dx=dx, dy=dy, sx=sx, sy=sy, method=method, hw=is_hw, filled=interp_boarders)
+        logger.info('KE and DIS saved to %s', store.folder)
+        return key
+    
     #- Saving
     save = 'y' # input('Want to save (y/n)?')
     if save == 'y':
@@ -123,20 +148,21 @@ def save_collapsed_spectra(ke, dis, year, scheme, dx, dy, sx, sy, folder, method
         f2 = folder + 'collapsed2D_DIS_' + flag
         
         np.save(f1, ke)
-        print('KE saved to {}'.format(f1))
+        logger.info('KE saved to %s', f1)
         np.save(f2, dis)
-        print('DIS saved to {}'.format(f2))
+        logger.info('DIS saved to %s', f2)
         
-        print('All data saved')
+        logger.info('All data saved')
         
         return (f1, f2)
     
     else:
-        print('No data saved')
+        logger.info('No data saved')
         
         return(None, None)
 
-def save_total_energetics_interpolated(ke, dis, year, scheme, dx, dy, sx, sy, folder, method, is_hw, interp_boarders):
+@instrumentation.instrumented('save')
+def save_total_energetics_interpolated(ke, dis, year, scheme, dx, dy, sx, sy, folder, method, is_hw, interp_boarders, store=None):
     """
     Description: 
         Saves total dissipation and kinetic energy of interpolated channel to specified folder at disk.
@@ -148,6 +174,8 @@ def save_total_energetics_interpolated(ke, dis, year, scheme, dx, dy, sx, sy, fo
         folder (str): location where to save data
         method (str): interpolation method
         is_hw (bool): if a Hanning Window was applied to data
+        interp_boarders (bool): If NaN values on the edges are interpolated by nearest neigbours or cut out
+        store (result_store.ResultStore): If given, the values are saved to the store instead of folder (Defaults: None)
     Returns:
         Saved data at disk
         f1, f2, f3, f4 (str): filenames
@@ -156,6 +184,13 @@ def save_total_energetics_interpolated(ke, dis, year, scheme, dx, dy, sx, sy, fo
     #- Modules
     import numpy as np
     
+    #- Result store
+    if store is not None:
+        key = store.save({'ke': ke, 'dis': dis}, quantity='total_energetics', scheme=scheme, year=year, 
+                         dx=dx, dy=dy, sx=sx, sy=sy, method=method, hw=is_hw, filled=interp_boarders)
+        logger.info('KE and DIS saved to %s', store.folder)
+        return key
+    
     #- Saving
     save = 'y' #input('Want to save (y/n)?')
     if save == 'y':
@@ -200,10 +235,10 @@ def save_total_energetics_interpolated(ke, dis, year, scheme, dx, dy, sx, sy, fo
         f2 = folder + 'total_energetics_dis_interp_' + flag
         
         np.save(f1, ke)
-        print('KE saved to {}'.format(f1))
+        logger.info('KE saved to %s', f1)
         np.save(f2, dis)
-        print('DIS saved to {}'.format(f2))
+        logger.info('DIS saved to %s', f2)
         
-        print('All data saved')  
+        logger.info('All data saved')  
     else:
-        print('No data saved')
\ No newline at end of file
+        logger.info('No data saved')
\ No newline at end of file
@@ -0,0 +1,298 @@
+import contextlib
+
+from eddies.common import instrumentation
+
+class ResultStore:
+    """
+    Description:
+        Stores results of the analysis (interpolated values, collapsed spectra, total energetics) in one folder,
+        keyed by their parameters instead of flags in filenames. A small index file (index.json) maps the
+        parameters of each result to the .npz file holding its arrays, so lookups, listings and filtered queries
+        only read the index. Files and index are written atomically, updates of the index are serialized by a
+        lock file (index.lock), such that several processes can save to the same store. pack() merges all results
+        into a single .npz file, such that loading thousands of results opens one file.
+        
+        Example:
+        store = ResultStore('../resources/results/')
+        store.save({'ke': ke, 'dis': dis}, quantity='total_energetics', scheme=scheme, year=year,
+                   dx=dx, dy=dy, sx=sx, sy=sy, method=method, hw=False, filled=True)
+        results = store.load_many(quantity='total_energetics', dx=0.09, method=['nearest', 'linear'])
+    Parameters:
+        folder (str): Folder of the store, created if it does not exist
+    """
+    index_file = 'index.json'
+    lock_file  = 'index.lock'
+    
+    def __init__(self, folder):
+        #- Modules
+        import os
+        
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.refresh()
+    
+    def refresh(self):
+        """
+        Description:
+            Reads the index from disk, e.g. after another process saved results.
+        """
+        #- Modules
+        import os
+        import json
+        
+        path = os.path.join(self.folder, self.index_file)
+        if os.path.exists(path):
+            with open(path) as f:
+                index = json.load(f)
+            self._index = {self.key(entry['params']): entry for entry in index.values()} # Keys of older stores
+        else:
+            self._index = {}
+    
+    @staticmethod
+    def normalize(params):
+        """
+        Description:
+            Normalizes parameters to JSON types. Numbers are rounded to 4 decimals as in the filenames of data_saver
+            and have one type, such that e.g. sx=0 and sx=0.0 give the same key: int if they are whole numbers,
+            float otherwise.
+        Parameters:
+            params (dict): Parameters of a result
+        Returns:
+            params (dict): Normalized parameters
+        """
+        #- Modules
+        import numpy as np
+        
+        normalized = {}
+        for name, value in params.items():
+            if isinstance(value, (bool, np.bool_)):
+                value = bool(value)
+            elif isinstance(value, (int, np.integer, float, np.floating)):
+                value = float(np.round(value, decimals=4))
+                if value.is_integer():
+                    value = int(value)
+            else:
+                value = str(value)
+            normalized[name] = value
+        
+        return normalized
+    
+    @classmethod
+    def key(cls, params):
+        """
+        Description:
+            Key of a result, a hash of its normalized parameters.
+        Parameters:
+            params (dict): Parameters of a result
+        Returns:
+            key (str)
+        """
+        #- Modules
+        import json
+        import hashlib
+        
+        params = cls.normalize(params)
+        
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    
+    @instrumentation.instrumented('save')
+    def save(self, arrays, **params):
+        """
+        Description:
+            Saves arrays of one result. An existing result with the same parameters is replaced.
+        Parameters:
+            arrays (dict): Arrays by name, e.g. {'ke': ke, 'dis': dis}
+            params: Parameters of the result, e.g. quantity, scheme, year, dx, dy, sx, sy, method, hw, filled
+        Returns:
+            key (str): Key of the result
+        """
+        #- Modules
+        import numpy as np
+        
+        key  = self.key(params)
+        file = key + '.npz'
+        self._write(file, lambda f: np.savez(f, **arrays))
+        
+        with self._lock():
+            self.refresh() # Keep results saved meanwhile by other processes
+            self._index[key] = {'params': self.normalize(params), 'file': file, 'prefix': ''}
+            self._write_index()
+        
+        return key
+    
+    def exists(self, **params):
+        """
+        Description:
+            Whether a result with exactly these parameters is stored.
+        Parameters:
+            params: Parameters of the result
+        Returns:
+            (bool)
+        """
+        return self.key(params) in self._index
+    
+    def load(self, **params):
+        """
+        Description:
+            Loads the arrays of the result with exactly these parameters.
+        Parameters:
+            params: Parameters of the result
+        Returns:
+            arrays (dict): Arrays by name
+        """
+        key = self.key(params)
+        if key not in self._index:
+            raise KeyError('No result stored for ' + str(self.normalize(params)))
+        
+        return self._load_entries([self._index[key]])[0]
+    
+    def query(self, **filters):
+        """
+        Description:
+            Lists the parameters of all results matching the filters. Only reads the index.
+        Parameters:
+            filters: Parameter values to match. A list or tuple matches any of its values,
+                a callable is called with the value. Results without a filtered parameter do not match.
+        Returns:
+            (list): Parameters (dict) of the matching results
+        """
+        return [entry['params'] for entry in self._match(filters)]
+    
+    def load_many(self, **filters):
+        """
+        Description:
+            Loads all results matching the filters (see query). Each file is opened once.
+        Parameters:
+            filters: Parameter values to match
+        Returns:
+            (list): (params, arrays) of the matching results
+        """
+        entries = self._match(filters)
+        
+        return list(zip([entry['params'] for entry in entries], self._load_entries(entries)))
+    
+    def pack(self):
+        """
+        Description:
+            Merges all stored results into a single .npz file and removes the files of single results.
+            Results are copied one file at a time, such that large results (e.g. interpolated fields)
+            are never all in memory.
+        Returns:
+            file (str): Filename of the packed results
+        """
+        #- Modules
+        import os
+        import zipfile
+        import numpy as np
+        
+        with self._lock():
+            self.refresh()
+            
+            by_file = {}
+            for key, entry in self._index.items():
+                by_file.setdefault(entry['file'], []).append(key)
+            
+            file = 'packed_' + self.key({'keys': ','.join(sorted(self._index))}) + '.npz'
+            
+            def write(f):
+                with zipfile.ZipFile(f, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                    for old, keys in by_file.items():
+                        with np.load(os.path.join(self.folder, old)) as data: # Arrays are read on access
+                            for key in keys:
+                                prefix = self._index[key]['prefix']
+                                for name in data.files:
+                                    if not name.startswith(prefix) or '/' in name[len(prefix):]:
+                                        continue
+                                    with zf.open(key + '/' + name[len(prefix):] + '.npy', mode='w',
+                                                 force_zip64=True) as member:
+                                        np.lib.format.write_array(member, data[name], allow_pickle=False)
+            
+            self._write(file, write)
+            
+            for key in self._index:
+                self._index[key]['file']   = file
+                self._index[key]['prefix'] = key + '/'
+            self._write_index()
+            
+            for old in set(by_file) - {file}:
+                os.remove(os.path.join(self.folder, old))
+        
+        return file
+    
+    def _match(self, filters):
+        """Index entries matching the filters (see query)"""
+        entries = []
+        for entry in self._index.values():
+            params  = entry['params']
+            matches = True
+            for name, value in filters.items():
+                if name not in params:
+                    matches = False
+                elif callable(value):
+                    matches = bool(value(params[name]))
+                elif isinstance(value, (list, tuple)):
+                    matches = params[name] in [self.normalize({name: v})[name] for v in value]
+                else:
+                    matches = params[name] == self.normalize({name: value})[name]
+                if not matches:
+                    break
+            if matches:
+                entries.append(entry)
+        
+        return entries
+    
+    def _load_entries(self, entries):
+        """Arrays of index entries, each file is opened once"""
+        #- Modules
+        import os
+        import numpy as np
+        
+        results = [None] * len(entries)
+        by_file = {}
+        for i, entry in enumerate(entries):
+            by_file.setdefault(entry['file'], []).append(i)
+        
+        for file, positions in by_file.items():
+            with np.load(os.path.join(self.folder, file)) as data:
+                for i in positions:
+                    prefix     = entries[i]['prefix']
+                    results[i] = {name[len(prefix):]: data[name] for name in data.files if name.startswith(prefix)
+                                  and '/' not in name[len(prefix):]}
+        
+        return results
+    
+    def _write(self, file, write):
+        """Writes a file under a temporary name and renames it, such that readers never see partial files"""
+        #- Modules
+        import os
+        import tempfile
+        
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, os.path.join(self.folder, file))
+        except BaseException:
+            os.remove(tmp)
+            raise
+    
+    @contextlib.contextmanager
+    def _lock(self):
+        """Exclusive lock of the index across processes, held while the index is read, changed and written"""
+        #- Modules
+        import os
+        import fcntl
+        
+        with open(os.path.join(self.folder, self.lock_file), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _write_index(self):
+        """Writes the index atomically"""
+        #- Modules
+        import json
+        
+        self._write(self.index_file, lambda f: f.write(json.dumps(self._index, indent=1, sort_keys=True).encode()))
@@ -0,0 +1,238 @@
+class StageCache:
+    """
+    Description:
+        Disk cache of the results of expensive stages (e.g. interpolator.interpolate_to_grid,
+        interpolation_tools.fill_boarders, spectra.get_2D_spectrum). A result is keyed by a hash of the stage,
+        the fingerprints of its input arrays and its parameters. Cached results are loaded memory-mapped and
+        read-only. The least recently used results are evicted when the cache grows beyond max_bytes.
+        
+        Example:
+        cache  = StageCache('../resources/cache/', max_bytes=100e9)
+        interp = cache.memoize(interpolator.interpolate_to_grid, ignore=('plan', 'n_workers'))
+        fill   = cache.memoize(interpolation_tools.fill_boarders, writable=True)
+        u_int  = fill(interp(u, xx0, yy0, XX1, YY1, days, lvls, 'linear'))
+    Parameters:
+        folder (str): Folder of the cache, created if it does not exist
+        max_bytes (float): Maximum size of the cache in bytes (Defaults: 50e9)
+    """
+    def __init__(self, folder, max_bytes=50e9):
+        #- Modules
+        import os
+        
+        self.folder    = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+    
+    def memoize(self, func, ignore=(), writable=False):
+        """
+        Description:
+            Wraps a stage, such that its results are taken from the cache if it was called with the same inputs before.
+        Parameters:
+            func (callable): Stage returning an array or a tuple of arrays
+            ignore (tuple): Names of parameters that do not change the result (e.g. 'plan', 'n_workers'). Other
+                parameters must be arrays, array-like values, scalars, strings or containers of these
+            writable (bool): Whether func modifies its input arrays in place (e.g. fill_boarders). Read-only inputs,
+                like results of other cached stages, are then copied before func is called (Defaults: False)
+        Returns:
+            (callable): Cached stage with the signature of func
+        """
+        #- Modules
+        import functools
+        
+        @functools.wraps(func)
+        def cached(*args, **kwargs):
+            return self.call(func, *args, _ignore=ignore, _writable=writable, **kwargs)
+        
+        return cached
+    
+    def call(self, func, *args, _ignore=(), _writable=False, **kwargs):
+        """
+        Description:
+            Calls a stage or loads its result from the cache (see memoize).
+        Parameters:
+            func (callable): Stage returning an array or a tuple of arrays
+            args, kwargs: Arguments of func
+        Returns:
+            Result of func, memory-mapped and read-only if it was cached
+        """
+        #- Modules
+        import os
+        import inspect
+        import numpy as np
+        
+        #- Key of the stage and its arguments
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = {name: value for name, value in bound.arguments.items() if name not in _ignore}
+        key    = self._key(func.__module__ + '.' + func.__qualname__, params)
+        entry  = os.path.join(self.folder, key)
+        
+        #- Cached result
+        if os.path.isdir(entry):
+            try:
+                result = self._load(entry)
+                os.utime(entry) # Most recently used
+                return result
+            except FileNotFoundError: # Evicted meanwhile by another process
+                pass
+        
+        #- Compute and cache result
+        if _writable:
+            bound = inspect.signature(func).bind(*args, **kwargs)
+            for name, value in bound.arguments.items():
+                if isinstance(value, np.ndarray) and not value.flags.writeable:
+                    bound.arguments[name] = np.array(value)
+            args, kwargs = bound.args, bound.kwargs
+        
+        result = func(*args, **kwargs)
+        self._save(entry, result)
+        self._evict()
+        
+        return result
+    
+    def clear(self):
+        """
+        Description:
+            Removes all cached results.
+        """
+        #- Modules
+        import os
+        import shutil
+        
+        for name in os.listdir(self.folder):
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+    
+    def _key(self, stage, params):
+        """Hash of the stage and the fingerprints of its parameters"""
+        #- Modules
+        import hashlib
+        
+        h = hashlib.sha1(stage.encode())
+        for name in sorted(params):
+            h.update(name.encode())
+            _fingerprint(params[name], h)
+        
+        return h.hexdigest()
+    
+    def _save(self, entry, result):
+        """Saves a result to a temporary folder and renames it to the folder of the entry"""
+        #- Modules
+        import os
+        import json
+        import shutil
+        import tempfile
+        import numpy as np
+        
+        is_tuple = isinstance(result, tuple)
+        arrays   = result if is_tuple else (result,)
+        
+        tmp = tempfile.mkdtemp(dir=self.folder, prefix='.tmp_')
+        try:
+            for i, a in enumerate(arrays):
+                np.save(os.path.join(tmp, str(i) + '.npy'), np.asarray(a))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'tuple': is_tuple, 'n': len(arrays)}, f)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True) # Saved meanwhile by another process
+            if not os.path.isdir(entry):
+                raise
+    
+    def _load(self, entry):
+        """Loads a cached result memory-mapped"""
+        #- Modules
+        import os
+        import json
+        import numpy as np
+        
+        with open(os.path.join(entry, 'meta.json')) as f:
+            meta = json.load(f)
+        
+        arrays = tuple(np.load(os.path.join(entry, str(i) + '.npy'), mmap_mode='r') for i in range(meta['n']))
+        
+        return arrays if meta['tuple'] else arrays[0]
+    
+    def _evict(self):
+        """Removes least recently used results until the cache is smaller than max_bytes"""
+        #- Modules
+        import os
+        import shutil
+        
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.startswith('.tmp_') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except FileNotFoundError:
+                continue
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total = total - size
+
+def _fingerprint(value, h):
+    """
+    Description:
+        Updates a hash with the fingerprint of a value. Arrays are hashed by their content, read-only memory-mapped
+        files (e.g. cached results) and netCDF variables by their filename and modification time, other array-like
+        values (with shape or __array__) by their content. Scalars, strings, slices and dtypes by their repr.
+    Parameters:
+        value: Value to fingerprint
+        h (hashlib hash): Hash to update
+    """
+    #- Modules
+    import os
+    import mmap
+    import numpy as np
+    
+    is_file = (isinstance(value, np.memmap) and isinstance(value.base, mmap.mmap) and not value.flags.writeable
+               and value.filename is not None and os.path.exists(value.filename)) # Not evicted meanwhile
+    
+    if is_file:
+        h.update(('memmap' + str(value.filename) + str(os.path.getmtime(value.filename))
+                  + str(value.offset) + str(value.shape) + str(value.dtype)).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(('array' + str(value.shape) + str(value.dtype)).encode())
+        h.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, (tuple, list)):
+        h.update(type(value).__name__.encode())
+        for v in value:
+            _fingerprint(v, h)
+    elif isinstance(value, dict):
+        for k in sorted(value):
+            h.update(repr(k).encode())
+            _fingerprint(value[k], h)
+    elif value is None or isinstance(value, (bool, int, float, complex, str, bytes, slice, range, np.generic,
+                                             np.dtype, type)):
+        h.update(repr(value).encode())
+    elif hasattr(value, 'shape') or hasattr(value, '__array__'):
+        filename = _variable_file(value)
+        if filename is not None:
+            h.update(('variable' + filename + str(os.path.getmtime(filename)) + str(getattr(value, 'name', ''))
+                      + str(value.shape)).encode())
+        else:
+            data = np.ma.asanyarray(value if hasattr(value, '__array__') else value[...]) # e.g. variables of MFDataset
+            h.update(type(value).__name__.encode())
+            _fingerprint(np.ma.getdata(data), h)
+            _fingerprint(np.ma.getmaskarray(data), h)
+    else:
+        raise TypeError('Cannot fingerprint a value of type ' + type(value).__name__ + ', pass it in ignore '
+                        'if it does not change the result')
+
+def _variable_file(value):
+    """File of a netCDF variable opened from a single file, None for other values or files that do not exist"""
+    #- Modules
+    import os
+    
+    try:
+        filename = value.group().filepath()
+    except Exception: # Not a netCDF variable or not available for this file
+        return None
+    
+    return filename if os.path.exists(filename) else None
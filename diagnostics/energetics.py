@@ -1,4 +1,6 @@
-def total_dis_orig(u, udis, v, vdis):
+from eddies.common import instrumentation
+
+def total_dis_orig(u, udis, v, vdis, mesh=None):
     """
     Description:
         Calculates mean dissipation in the channel from original velocities u,v and dissipation tendencies udis, vdis.
@@ -6,48 +8,28 @@ def total_dis_orig(u, udis, v, vdis):
     Parameters:
         u, v (np.array): Horizontal velocities, Shape:(days, elem_n, nz)
         udis, vdis (np.array): Horizontal dissipation tendencies, shape:(days, elem_n, nz)
+        mesh (FESOM_grid.Mesh): Mesh of u, v (Defaults: None, i.e. FESOM_grid.get_mesh())
     Output:
         dis (np.array): Spatial Mean dissipation in the channel averaged over amount of days, shape=(nz,)
     """
     
-    #- Modules
-    from eddies.grid import FESOM_grid
-    import numpy as np 
-    
-    #- Weights according to elem area
-    weights = FESOM_grid.elem_area / np.sum(FESOM_grid.elem_area) # Area of elements / Total Area
-    
-    #- Calculate dissipation
-    dis = u * udis + v * vdis
-    dis = np.swapaxes(dis, 1, 2) # Swap axes to multiply weights
-    dis = dis * weights # Weight DIS by area
-    dis = np.mean(np.sum(dis, axis=2), axis=0) # Sum over all elements, take mean over all days  
+    ke, dis = total_energetics_orig(u, udis, v, vdis, mesh=mesh)
     
     return dis
 
-def total_ke_orig(u, v):
+def total_ke_orig(u, v, mesh=None):
     """
     Description:
         Calculates mean Kinetic Energy in the channel from original velocities u,v.
         The Kinetic Energy in each grid cell is weighted by its area.
     Parameters:
         u, v (np.array): Horizontal velocities, shape:(days, elem_n, nz)
+        mesh (FESOM_grid.Mesh): Mesh of u, v (Defaults: None, i.e. FESOM_grid.get_mesh())
     Returns:
         ke (np.array): Spatial Mean Kinetic Energy in the channel averaged over amount of days, shape=(nz,)
     """
     
-    #- Modules
-    from eddies.grid import FESOM_grid
-    import numpy as np 
-    
-    #- Weights according to elem area
-    weights = FESOM_grid.elem_area / np.sum(FESOM_grid.elem_area) # Area of elements
-    
-    #- Calculate dissipation
-    ke = (1 / 2) * (u ** 2 + v ** 2)
-    ke = np.swapaxes(ke, 1, 2) # Swap axes to multiply weights
-    ke = ke * weights # Weight KE by area
-    ke = np.mean(np.sum(ke, axis=2), axis=0) # Sum over all elements, take mean over all days  
+    ke, dis = total_energetics_orig(u, None, v, None, mesh=mesh)
     
     return ke
 
@@ -63,22 +45,8 @@ def total_dis_interp(ui, udisi, vi, vdisi, grid_spacing):
     Returns:
     dis (np.array): Spatial Mean dissipation in the (interpolated) channel averaged over amount of days, shape=(nz,)
     """
-    #- Modules
-    import numpy as np
     
-    #- Parameters
-    deg2km    = 111
-    km2m      = 10 ** 3
-    dx        = grid_spacing * deg2km * km2m # Rectangle sidelength in m
-    ny        = ui.shape[1]
-    nx        = ui.shape[2]
-    nz        = ui.shape[3]
-    elem_area = np.ones(shape=(ny, nx, nz)) * dx ** 2 # Area of each element in the interpolated grid
-    weights   = elem_area / np.sum(elem_area, axis=(0,1)) 
-    
-    #- Calculate total dissipation
-    dis = np.nansum((ui * udisi + vi * vdisi) * weights, axis=(1,2)) # Sum over nx and ny gridpoints and skip nan values
-    dis = np.mean(dis, axis=0) # Mean over days
+    ke, dis = total_energetics_interp(ui, udisi, vi, vdisi, grid_spacing)
     
     return dis
 
@@ -93,21 +61,153 @@ def total_ke_interp(ui, vi, grid_spacing):
     Returns:
         ke (np.array): Spatial Mean Kinetic Energy in the (interpolated) channel averaged over amount of days, shape=(nz,)
     """
+    
+    ke, dis = total_energetics_interp(ui, None, vi, None, grid_spacing)
+    
+    return ke
+
+def total_energetics_orig(u, udis, v, vdis, mesh=None, block_days=1, block_levels=None, dtype=None):
+    """
+    Description:
+        Calculates mean Kinetic Energy and dissipation in the channel from original velocities u,v and
+        dissipation tendencies udis, vdis in a single pass over the data.
+        The energetics in each grid cell are weighted by its area.
+        The quantities can be lazy (np.memmap, netCDF variables or filenames of .npy files, which are
+        memory-mapped), only one block of days and levels is in memory at once. The results are identical to 
+        those of in-memory arrays for the same block sizes.
+    Parameters:
+        u, v (np.array): Horizontal velocities, shape:(days, elem_n, nz)
+        udis, vdis (np.array): Horizontal dissipation tendencies, shape:(days, elem_n, nz).
+            If None, only the Kinetic Energy is calculated.
+        mesh (FESOM_grid.Mesh): Mesh of u, v (Defaults: None, i.e. FESOM_grid.get_mesh())
+        block_days (int): Number of days processed at once (Defaults: 1)
+        block_levels (int): Number of levels processed at once (Defaults: None, i.e. all levels)
+        dtype (np.dtype): Data type of the blocks and products, e.g. np.float32. The area-weighted sums are
+            accumulated in float64 (Defaults: None, i.e. dtype of the quantities)
+    Returns:
+        ke, dis (np.array): Spatial Mean Kinetic Energy and dissipation in the channel averaged over amount of days,
+            shape=(nz,). dis is None without dissipation tendencies.
+    """
+    #- Modules
+    from eddies.grid import FESOM_grid
+    
+    #- Weights according to elem area
+    if mesh is None:
+        mesh = FESOM_grid.get_mesh()
+    
+    return _weighted_energetics(u, udis, v, vdis, mesh.elem_weights, block_days, block_levels, skipna=False, dtype=dtype)
+
+def total_energetics_interp(ui, udisi, vi, vdisi, grid_spacing, block_days=1, block_levels=None, dtype=None):
+    """
+    Description:
+        Calculates mean Kinetic Energy and dissipation in the channel from interpolated velocities u,v and
+        dissipation tendencies udis, vdis in a single pass over the data.
+        All grid cells of the rectangular grid have the same area and weight, NaN values are skipped.
+        The quantities can be lazy (see total_energetics_orig).
+    Parameters:
+        ui, vi (np.array): Interpolated horizontal velocities, shape:(days, ny, nx, nz)
+        udisi, vdisi (np.array): Horizontal dissipation tendencies, shape:(days, ny, nx, nz).
+            If None, only the Kinetic Energy is calculated.
+        grid_spacing (np.array): Grid_spacing of the interpolated rectangular (dx=dy) channel in degrees.
+        block_days (int): Number of days processed at once (Defaults: 1)
+        block_levels (int): Number of levels processed at once (Defaults: None, i.e. all levels)
+        dtype (np.dtype): Data type of the blocks and products, e.g. np.float32. The area-weighted sums are
+            accumulated in float64 (Defaults: None, i.e. dtype of the quantities)
+    Returns:
+        ke, dis (np.array): Spatial Mean Kinetic Energy and dissipation in the (interpolated) channel averaged over
+            amount of days, shape=(nz,). dis is None without dissipation tendencies.
+    """
     #- Modules
     import numpy as np
     
-    #- Parameter
-    deg2km    = 111
-    km2m      = 10 ** 3
-    dx        = grid_spacing * deg2km * km2m # Rectangle sidelength in m
-    ny        = ui.shape[1]
-    nx        = ui.shape[2]
-    nz        = ui.shape[3]
-    elem_area = np.ones(shape=(ny, nx, nz)) * dx ** 2 # Area of each element in the interpolated grid
-    weights   = elem_area / np.sum(elem_area, axis=(0,1)) 
+    #- Parameters
+    ui      = _as_source(ui)
+    ny      = ui.shape[1]
+    nx      = ui.shape[2]
+    weights = np.full(shape=ny * nx, fill_value=1 / (ny * nx)) # Area of each element / Total area, the grid spacing cancels
+    
+    return _weighted_energetics(ui, udisi, vi, vdisi, weights, block_days, block_levels, skipna=True, dtype=dtype)
 
-    #- Calculate total dissipation
-    ke = np.nansum((1 / 2) * (ui ** 2 + vi ** 2) * weights, axis=(1,2)) # Sum over nx and ny gridpoints and skip nan values
-    ke = np.mean(ke, axis=0) # Mean over days
+@instrumentation.instrumented('energetics')
+def _weighted_energetics(u, udis, v, vdis, weights, block_days, block_levels, skipna, dtype=None):
+    """
+    Description:
+        Area-weighted Kinetic Energy and dissipation summed over all grid cells and averaged over days.
+        The quantities are read once in blocks of days and levels. Per block, the products are formed in one
+        block-sized buffer and contracted with the weights along the grid cell axis. Products of single precision
+        are contracted in float64 without a float64 copy of the block.
+    Parameters:
+        u, udis, v, vdis (np.array): shape:(days, ..., nz), all axes between days and nz are grid cells.
+            Can be lazy (see _as_source), udis, vdis may be None.
+        weights (np.array): Normalized weights of the grid cells, shape:(cells,)
+        block_days (int): Number of days processed at once
+        block_levels (int): Number of levels processed at once, None for all levels
+        skipna (bool): Whether to skip grid cells with NaN values
+        dtype (np.dtype): Data type of the blocks and products (Defaults: None, i.e. dtype of the quantities)
+    Returns:
+        ke, dis (np.array): shape=(nz,), dis is None if udis, vdis are None
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    u, udis, v, vdis = (_as_source(q) for q in (u, udis, v, vdis))
+    days    = u.shape[0]
+    nz      = u.shape[-1]
+    has_dis = udis is not None and vdis is not None
+    ke      = np.zeros(nz)
+    dis     = np.zeros(nz) if has_dis else None
+    if block_levels is None:
+        block_levels = nz
+    
+    def block(q, d0, d1, l0, l1):
+        index = (slice(d0, d1),) + (slice(None),) * (len(q.shape) - 2) + (slice(l0, l1),)
+        b     = q[index]
+        if np.ma.isMaskedArray(b):
+            b = np.ma.filled(b, np.nan) # Masked values of netCDF variables
+        return np.ascontiguousarray(b, dtype=dtype).reshape(d1 - d0, -1, l1 - l0)
+    
+    def contract(a, b, c, d, out):
+        p = a * b # Block-sized buffer
+        p += c * d
+        if skipna:
+            p[np.isnan(p)] = 0
+        if p.dtype == weights.dtype:
+            out += np.sum(weights @ p, axis=0) # Sum over grid cells, then days of the block
+        else:
+            out += np.einsum('c,dcz->z', weights, p, dtype=np.float64, casting='same_kind')
+    
+    for d0 in range(0, days, block_days):
+        d1 = min(d0 + block_days, days)
+        for l0 in range(0, nz, block_levels):
+            l1 = min(l0 + block_levels, nz)
+            ub = block(u, d0, d1, l0, l1)
+            vb = block(v, d0, d1, l0, l1)
+            
+            contract(ub, ub, vb, vb, ke[l0:l1])
+            if has_dis:
+                contract(ub, block(udis, d0, d1, l0, l1), vb, block(vdis, d0, d1, l0, l1), dis[l0:l1])
+    
+    ke = (1 / 2) * ke / days # Mean over days
+    if has_dis:
+        dis = dis / days
+    
+    return (ke, dis)
+
+def _as_source(q):
+    """
+    Description:
+        Opens filenames of .npy files memory-mapped, other quantities (np.array, np.memmap, netCDF variables)
+        are returned as they are.
+    Parameters:
+        q (np.array or str): Quantity or filename
+    Returns:
+        q (np.array): Quantity supporting shape and slicing
+    """
+    #- Modules
+    import numpy as np
+    
+    if isinstance(q, str):
+        return np.load(q, mmap_mode='r')
     
-    return ke
\ No newline at end of file
+    return q
@@ -1,30 +1,128 @@
-def get_2D_spectrum(u, v, udis, vdis):
+import functools
+from eddies.common import instrumentation
+
+def get_2D_spectrum(u, v, udis, vdis, real=True, taper=None, normalize=False, dtype=None):
     """
     Description:
         Applies 2D-Fourier Transformation in zonal and meridional direction. Calculates Kinetic Energy and Dissipation Spectrum.
         Collapses 2D-Spectrum of Diagnostics to 1D.
+        The FFT backend (numpy, scipy, pyfftw) is set by fourier_tools.set_fft_backend or fourier_tools.fft_backend.
     Parameters:
         u, v (np.array): zonal velocities, shape:(days, ny, nx, nz)
         udis, vdis (np.array): dissipation tendencies, shape:(days, ny, nx, nz)
+        real (bool): Use the real-to-complex FFT, which only computes the half-spectrum of positive 
+            zonal wavenumbers. Gives the same spectra as the complex FFT with less time and memory (Defaults: True)
+        taper (str): Taper window (hann, tukey, none) multiplied in the meridional and zonal direction before the
+            transformation (see fourier_tools.taper_window). The quantities are tapered into one reused buffer
+            and are not modified (Defaults: None, i.e. no tapering)
+        normalize (bool): Restore the variance reduced by the taper window (Defaults: False)
+        dtype (np.dtype): Real data type of the transformation, e.g. np.float32 for single precision FFTs and 
+            2D-Spectra. The collapsed spectra are summed up in float64 (Defaults: None, i.e. dtype of u)
     Returns:
         ske_collapsed, sd_collapsed (np.array): Collapsed 2D-Spectra
         states (np.array): Wavenumber vector containing all wavenumbers used in each iteration of collapsing process
     """
+    return _collapsed_spectra(u, v, udis, vdis, real, taper=taper, normalize=normalize, dtype=dtype)
+
+def get_2D_spectrum_windows(u, v, udis, vdis, size, corners=None, stride=None, real=True, taper=None, normalize=False,
+                            dtype=None):
+    """
+    Description:
+        Calculates collapsed Kinetic Energy and Dissipation Spectra (see get_2D_spectrum) for many equally sized 
+        subdomains of the channel at once. All windows are stacked and transformed by one batched 2D-Fourier 
+        Transformation and collapsed together.
+        The windows are given by their lower left corners or by a sliding window with a given stride.
+    Parameters:
+        u, v (np.array): zonal velocities, shape:(days, ny, nx, nz)
+        udis, vdis (np.array): dissipation tendencies, shape:(days, ny, nx, nz)
+        size (tuple): Size of each window in gridpoints (wy, wx)
+        corners (list): Lower left corners (y0, x0) of the windows in gridpoints (Defaults: None)
+        stride (tuple): Stride (sy, sx) of a sliding window over the whole channel, used if corners is None 
+            (Defaults: None, i.e. the window is moved by its own size)
+        real (bool): Use the real-to-complex FFT (see get_2D_spectrum) (Defaults: True)
+        taper (str): Taper window (hann, tukey, none) of the size of the windows, applied to each window 
+            (see get_2D_spectrum) (Defaults: None, i.e. no tapering)
+        normalize (bool): Restore the variance reduced by the taper window (Defaults: False)
+        dtype (np.dtype): Real data type of the transformation (see get_2D_spectrum) (Defaults: None, i.e. dtype of u)
+    Returns:
+        ske_collapsed, sd_collapsed (np.array): Collapsed 2D-Spectra, shape:(n_windows, days, k, nz)
+        states (np.array): Wavenumber vector containing all wavenumbers used in each iteration of collapsing process
+        corners (np.array): Lower left corners (y0, x0) of the windows, shape:(n_windows, 2)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    ny     = u.shape[1]
+    nx     = u.shape[2]
+    wy, wx = size
+    
+    #- Exceptions
+    assert wy <= ny and wx <= nx, 'Windows must fit into the channel'
+    
+    #- Lower left corners of the windows
+    if corners is None:
+        if stride is None:
+            stride = size
+        y0, x0  = np.meshgrid(np.arange(0, ny - wy + 1, stride[0]), np.arange(0, nx - wx + 1, stride[1]), indexing='ij')
+        corners = np.column_stack((y0.ravel(), x0.ravel()))
+    corners = np.asarray(corners, dtype=int).reshape(-1, 2)
+    
+    assert np.all(corners >= 0), 'Windows must fit into the channel'
+    assert np.all(corners[:, 0] + wy <= ny) and np.all(corners[:, 1] + wx <= nx), 'Windows must fit into the channel'
+    
+    #- Stack windows, shape:(n_windows, days, wy, wx, nz)
+    def stack(q):
+        windows = np.lib.stride_tricks.sliding_window_view(q, (wy, wx), axis=(1, 2)) # View, shape:(days, ny-wy+1, nx-wx+1, nz, wy, wx)
+        
+        return np.moveaxis(windows[:, corners[:, 0], corners[:, 1]], (0, 1, 2), (1, 0, 4))
+    
+    ske_collapsed, sd_collapsed, states = _collapsed_spectra(stack(u), stack(v), stack(udis), stack(vdis), real,
+                                                             taper=taper, normalize=normalize, dtype=dtype)
+    
+    return (ske_collapsed, sd_collapsed, states, corners)
+
+def _collapsed_spectra(u, v, udis, vdis, real=True, taper=None, normalize=False, dtype=None):
+    """
+    Description:
+        Collapsed Kinetic Energy and Dissipation Spectra of quantities with an arbitrary number of leading axes.
+        The 2D-Fourier Transformation is applied along the axes (-3, -2).
+    Parameters:
+        u, v, udis, vdis (np.array): shape:(..., ny, nx, nz)
+        real (bool): Use the real-to-complex FFT (Defaults: True)
+        taper (str): Taper window applied before the transformation (Defaults: None)
+        normalize (bool): Restore the variance reduced by the taper window (Defaults: False)
+        dtype (np.dtype): Real data type of the transformation (Defaults: None, i.e. dtype of u)
+    Returns:
+        ske_collapsed, sd_collapsed (np.array): Collapsed 2D-Spectra, shape:(..., k, nz)
+        states (np.array): Wavenumber vector containing all wavenumbers used in each iteration of collapsing process
+    """
     #- Modules
     import numpy as np
     from eddies.common import fourier_tools
     
     #- Parameters
-    days = u.shape[0]
-    ny   = u.shape[1] # number of meridional gridpoints
-    nx   = u.shape[2] # number of zonal gridpoints
-    nz   = u.shape[3] # number of vertical gridpoints
+    lead = u.shape[:-3] # e.g. (days,) or (windows, days)
+    ny   = u.shape[-3] # number of meridional gridpoints
+    nx   = u.shape[-2] # number of zonal gridpoints
+    nz   = u.shape[-1] # number of vertical gridpoints
+    
+    prepare = _fft_input(u, taper, normalize, dtype)
+    
+    if real == True:
+        ske, sd = _half_spectra(u, v, udis, vdis, prepare)
+        
+        #- Compute isotropic spectrum
+        ske_collapsed, states = collapse_spectrum(ske)
+        sd_collapsed, _       = collapse_spectrum(sd)
+        
+        return (ske_collapsed, sd_collapsed, states)
     
     #- 2D-Fourier Transform
-    fu    = np.fft.fft2(u, axes=(1,2)) # FFT applied in meridional and zonal direction
-    fv    = np.fft.fft2(v, axes=(1,2))
-    fudis = np.fft.fft2(udis, axes=(1,2))
-    fvdis = np.fft.fft2(vdis, axes=(1,2))  
+    fu    = fourier_tools.fft2(prepare(u), axes=(-3,-2)) # FFT applied in meridional and zonal direction
+    fv    = fourier_tools.fft2(prepare(v), axes=(-3,-2))
+    fudis = fourier_tools.fft2(prepare(udis), axes=(-3,-2))
+    fvdis = fourier_tools.fft2(prepare(vdis), axes=(-3,-2))  
     
     #- Energy Diagnostics
     ske = np.real(fu * np.conj(fu) + fv * np.conj(fv)) / (2 * ny ** 2 * nx ** 2)   # Kinetic Energy
@@ -32,25 +130,255 @@ def get_2D_spectrum(u, v, udis, vdis):
     
     #- Reduce to positive wavenumbers k+ including Nyquist Frequency and k=0, e.g. DC-component
     #- Positive k in first half of all axes (see docs of np.fft.fft2)
-    ske[:, 1:ny//2+1, 1:nx//2+1, :] = 2 * np.real(ske[:, 1:ny//2+1, 1:nx//2+1, :])  # Leave out DC. +1 to include NF.
-    sd[:, 1:ny//2+1, 1:nx//2+1, :]  = 2 * np.real(sd[:, 1:ny//2+1, 1:nx//2+1, :])   # If nx,ny are odd or even does not matter
+    ske[..., 1:ny//2+1, 1:nx//2+1, :] = 2 * np.real(ske[..., 1:ny//2+1, 1:nx//2+1, :])  # Leave out DC. +1 to include NF.
+    sd[..., 1:ny//2+1, 1:nx//2+1, :]  = 2 * np.real(sd[..., 1:ny//2+1, 1:nx//2+1, :])   # If nx,ny are odd or even does not matter
+    
+    ske = ske[..., :ny//2+1, :nx//2+1, :] # Keep all wavenumber up to NF
+    sd  = sd[..., :ny//2+1, :nx//2+1, :]
     
-    ske = ske[:, :ny//2+1, :nx//2+1, :] # Keep all wavenumber up to NF
-    sd  = sd[:, :ny//2+1, :nx//2+1, :]
-       
     #- Compute isotropic spectrum
-    states         = [] # saves all collapsedsed wavenumbers
-    kmax_collapsed = int(np.round(np.sqrt( (nx // 2 + 1) ** 2 + (ny // 2 + 1) ** 2))) # Number of max. collapsed wavenumber
-    ske_collapsed  = np.zeros(shape=(days, kmax_collapsed, nz)) # collapsedsed 2d Spectra
-    sd_collapsed   = np.zeros(shape=(days, kmax_collapsed, nz)) 
+    ske_collapsed, states = collapse_spectrum(ske)
+    sd_collapsed, _       = collapse_spectrum(sd)
+    
+    return (ske_collapsed, sd_collapsed, states)
+
+def _half_spectra(u, v, udis, vdis, prepare=None):
+    """
+    Description:
+        Kinetic Energy and Dissipation Spectra of positive wavenumbers from the real-to-complex FFT. 
+        The zonal transform only yields kx = 0, ..., nx//2 and only ky = 0, ..., ny//2 is kept, which are 
+        exactly the wavenumbers kept from the complex FFT. The co-spectra are formed field by field in place, 
+        such that at most three transformed fields are alive at once.
+    Parameters:
+        u, v, udis, vdis (np.array): shape:(..., ny, nx, nz)
+        prepare (callable): Prepares each quantity for the transformation, e.g. tapering (see _fft_input)
+            (Defaults: None)
+    Returns:
+        ske, sd (np.array): 2D-Spectra of positive wavenumbers, shape:(..., ny//2+1, nx//2+1, nz)
+    """
+    #- Modules
+    import numpy as np
+    from eddies.common import fourier_tools
+    
+    #- Parameters
+    ny = u.shape[-3] # number of meridional gridpoints
+    nx = u.shape[-2] # number of zonal gridpoints
+    
+    def transform(q):
+        if prepare is not None:
+            q = prepare(q)
+        return fourier_tools.rfft2(q, axes=(-3,-2))[..., :ny//2+1, :, :] # Keep ky up to NF
+    
+    def cospectrum(fa, fb, out):
+        out += fa.real * fb.real # Re(fa * conj(fb))
+        out += fa.imag * fb.imag
+    
+    #- Kinetic Energy
+    fu  = transform(u)
+    fv  = transform(v)
+    ske = np.zeros(shape=fu.shape, dtype=fu.real.dtype)
+    cospectrum(fu, fu, ske)
+    cospectrum(fv, fv, ske)
+    ske /= (2 * ny ** 2 * nx ** 2)
+    
+    #- Dissipation
+    sd = np.zeros(shape=fu.shape, dtype=fu.real.dtype)
+    cospectrum(fu, transform(udis), sd)
+    del fu
+    cospectrum(fv, transform(vdis), sd)
+    del fv
+    sd /= (ny ** 2 * nx ** 2)
+    
+    #- Positive k of both axes count twice, DC and axes ky=0, kx=0 once (see complex FFT)
+    ske[..., 1:, 1:, :] *= 2
+    sd[..., 1:, 1:, :]  *= 2
+    
+    return (ske, sd)
+
+def _fft_input(u, taper, normalize, dtype):
+    """
+    Description:
+        Prepares quantities of the shape of u for the transformation. Each quantity is multiplied by the cached
+        taper window and/or converted to dtype in one buffer, which is allocated once and reused for all quantities.
+    Parameters:
+        u (np.array): shape:(..., ny, nx, nz)
+        taper (str): Taper window (hann, tukey, none), None for no tapering
+        normalize (bool): Restore the variance reduced by the taper window
+        dtype (np.dtype): Real data type of the transformation, None for the dtype of u
+    Returns:
+        prepare (callable): Returns the quantity to transform
+    """
+    #- Modules
+    import numpy as np
+    from eddies.common import fourier_tools
+    
+    if dtype is None:
+        dtype = np.result_type(u.dtype, np.float32) if taper is not None else u.dtype
+    dtype = np.dtype(dtype)
+    
+    if taper is None and dtype == u.dtype:
+        return lambda q: q
+    
+    buffer = np.empty(np.shape(u), dtype=dtype)
+    
+    if taper is None:
+        def prepare(q):
+            np.copyto(buffer, q, casting='same_kind')
+            return buffer
+        
+        return prepare
+    
+    window = fourier_tools.taper_window(u.shape[-3], u.shape[-2], taper, normalize=normalize)[:, :, np.newaxis]
+    window = window.astype(dtype, copy=False)
+    
+    def prepare(q):
+        with instrumentation.stage('window', nbytes=q.nbytes):
+            return np.multiply(q, window, out=buffer, casting='same_kind')
+    
+    return prepare
+
+@instrumentation.instrumented('collapse')
+def collapse_spectrum(s):
+    """
+    Description:
+        Collapses a 2D-Spectrum of positive wavenumbers (ky, kx) to 1D by summing up all (ky, kx) of the 
+        same rounded wavenumber k = sqrt(kx ** 2 + ky ** 2) in a single reduction over a cached bin map.
+        The sums are accumulated in float64, also for single precision spectra.
+    Parameters:
+        s (np.array): 2D-Spectrum, shape:(..., ny//2+1, nx//2+1, nz)
+    Returns:
+        s_collapsed (np.array): Collapsed 2D-Spectrum, shape:(..., k, nz)
+        states (np.array): Wavenumber vector containing all wavenumbers used in each iteration of collapsing process
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    ny = 2 * (s.shape[-3] - 1) # Even and odd number of gridpoints share the same bins
+    nx = 2 * (s.shape[-2] - 1)
+    states, ky, kx, starts, bins, kmax_collapsed = _radial_bins(ny, nx)
+    
+    #- Sum over all (ky, kx) sorted by their wavenumber k
+    s_sorted    = s[..., ky, kx, :]
+    s_collapsed = np.zeros(shape=s.shape[:-3] + (kmax_collapsed, s.shape[-1]))
+    s_collapsed[..., bins, :] = np.add.reduceat(s_sorted, starts, axis=-2, dtype=np.float64) # Summed up in float64
+    
+    return (s_collapsed, states)
+
+@functools.lru_cache(maxsize=None)
+def _radial_bins(ny, nx):
+    """
+    Description:
+        Bin map of the isotropic spectrum for ny, nx gridpoints. Computed once per (ny, nx).
+    Parameters:
+        ny, nx (int): number of meridional and zonal gridpoints
+    Returns:
+        states (np.array): Collapsed wavenumber k of each (ky, kx) in the order ky, kx
+        ky, kx (np.array): Wavenumbers sorted by k
+        starts (np.array): First position of each k in the sorted wavenumbers
+        bins (np.array): Collapsed wavenumbers k
+        kmax_collapsed (int): Number of max. collapsed wavenumber
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Collapsed wavenumber of each (ky, kx)
+    ky, kx = np.meshgrid(np.arange(ny//2+1), np.arange(nx//2+1), indexing='ij') # meridional, zonal
+    states = np.round(np.sqrt(kx ** 2 + ky ** 2)).astype(int).ravel() # Round up for values >= .5
+    kmax_collapsed = int(np.round(np.sqrt( (nx // 2 + 1) ** 2 + (ny // 2 + 1) ** 2)))
+    
+    #- Sort by collapsed wavenumber
+    order        = np.argsort(states, kind='stable')
+    bins, starts = np.unique(states[order], return_index=True)
+    ky           = ky.ravel()[order]
+    kx           = kx.ravel()[order]
+    
+    for a in (states, ky, kx, starts, bins):
+        a.flags.writeable = False # Shared by all callers
+    
+    return (states, ky, kx, starts, bins, kmax_collapsed)
+
+class SpectrumAccumulator:
+    """
+    Description:
+        Running statistics of collapsed Kinetic Energy and Dissipation Spectra over days. It is fed day by day 
+        or chunk by chunk and keeps the running mean and variance (Welford, combined for chunks by Chan et al.) 
+        of both spectra for each wavenumber and level. Memory is independent of the length of the record.
+        
+        Example:
+        acc = SpectrumAccumulator()
+        for chunk in chunks:
+            ske, sd, states = get_2D_spectrum(*chunk)
+            acc.update(ske, sd)
+        (ske_low, ske_high), (sd_low, sd_high) = acc.confidence_interval(0.95)
+    Attributes:
+        count (int): Number of days
+        mean (tuple): Time mean of ske_collapsed and sd_collapsed, shape:(k, nz) each
+        variance (tuple): Sample variance over days of ske_collapsed and sd_collapsed, shape:(k, nz) each
+    """
+    def __init__(self):
+        self.count = 0
+        self._mean = None # Running means of ske and sd
+        self._m2   = None # Running sums of squared deviations of ske and sd
+    
+    def update(self, ske_collapsed, sd_collapsed):
+        """
+        Description:
+            Adds collapsed spectra of one day or a chunk of days.
+        Parameters:
+            ske_collapsed, sd_collapsed (np.array): Collapsed 2D-Spectra, shape:(days, k, nz) or (k, nz)
+        """
+        #- Modules
+        import numpy as np
+        
+        batch = [np.asarray(s, dtype=np.float64) for s in (ske_collapsed, sd_collapsed)]
+        if batch[0].ndim == 2:
+            batch = [s[np.newaxis] for s in batch] # One day
+        
+        #- Statistics of the chunk
+        n_b    = batch[0].shape[0]
+        mean_b = [np.mean(s, axis=0) for s in batch]
+        m2_b   = [np.sum((s - m) ** 2, axis=0) for s, m in zip(batch, mean_b)]
+        
+        #- Combine with the running statistics
+        if self.count == 0:
+            self._mean = mean_b
+            self._m2   = m2_b
+        else:
+            n_a = self.count
+            n   = n_a + n_b
+            for i in range(2):
+                delta         = mean_b[i] - self._mean[i]
+                self._mean[i] = self._mean[i] + delta * n_b / n
+                self._m2[i]   = self._m2[i] + m2_b[i] + delta ** 2 * n_a * n_b / n
+        
+        self.count = self.count + n_b
     
-    for ky in range(ny//2+1): # meridional
-        for kx in range(nx//2+1): # zonal
-            kk = int(np.round(np.sqrt(kx ** 2 + ky ** 2))) # Round up for values >= .5, 
-            ske_collapsed[:, kk,:] = ske_collapsed[:, kk, :] + ske[:, ky, kx, :]
-            sd_collapsed[:, kk, :] = sd_collapsed[:, kk, :] + sd[:, ky, kx, :]
-            states.append(kk)
+    @property
+    def mean(self):
+        assert self.count > 0, 'No spectra added'
+        return tuple(self._mean)
     
-    states = np.array(states)
+    @property
+    def variance(self):
+        assert self.count > 1, 'At least two days are needed for the variance'
+        return tuple(m2 / (self.count - 1) for m2 in self._m2)
     
-    return (ske_collapsed, sd_collapsed, states)
\ No newline at end of file
+    def confidence_interval(self, confidence=0.95):
+        """
+        Description:
+            Confidence interval of the time mean spectra from Student's t-distribution. 
+            Days are treated as independent samples, the interval is too narrow for correlated days.
+        Parameters:
+            confidence (float): Confidence level (Defaults: 0.95)
+        Returns:
+            (ske_low, ske_high), (sd_low, sd_high) (np.array): Bounds of the confidence interval, shape:(k, nz)
+        """
+        #- Modules
+        import numpy as np
+        from scipy import stats
+        
+        t = stats.t.ppf((1 + confidence) / 2, df=self.count - 1)
+        
+        return tuple((m - t * np.sqrt(var / self.count), m + t * np.sqrt(var / self.count))
+                     for m, var in zip(self.mean, self.variance))
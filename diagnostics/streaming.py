@@ -0,0 +1,119 @@
+def iter_day_chunks(u, udis, v, vdis, chunk_days, days=None):
+    """
+    Description:
+        Yields the original velocities and dissipation tendencies in chunks of chunk_days days.
+        Only the sliced days are read, if the inputs are lazy (e.g. netCDF variables or np.memmap).
+    Parameters:
+        u, udis, v, vdis (np.array): Velocities and dissipation tendencies, shape:(days, elem_n, nz)
+            as returned by data_loader.load_original_data
+        chunk_days (int): Number of days in each chunk
+        days (int): Last day to process starting from day=0 (Defaults: None, i.e. all days)
+    Yields:
+        u, udis, v, vdis (np.array): Chunk of the quantities, shape:(chunk_days, elem_n, nz)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    if days is None:
+        days = u.shape[0]
+    
+    for d0 in range(0, days, chunk_days):
+        d1 = min(d0 + chunk_days, days)
+        yield tuple(np.asarray(q[d0:d1]) for q in (u, udis, v, vdis))
+
+def stream_spectra(chunks, xx0, yy0, XX1, YY1, lvls, method, grid_spacing, is_hw=False, interp_boarders=True, n_workers=None, 
+                   accumulator=None, dtype=None):
+    """
+    Description:
+        Streams chunks of days from the original grid to collapsed 2D-Spectra and total energetics of the
+        interpolated channel. Each chunk is interpolated, its boarders are filled (or cut), a Hanning Window
+        is applied (optional) and it is transformed. The collapsed spectra and energetics are added up over
+        all chunks, so peak memory is bounded by the size of a chunk rather than the length of the record.
+        
+        Example:
+        chunks = data_loader.load_original_data(path, year, model_run, levels=slice(0, lvls), chunk_days=10)
+        ske, sd, states, ke, dis = streaming.stream_spectra(chunks, xx0, yy0, XX1, YY1, lvls, 'linear', dx)
+        
+        Arrays already in memory (or memory-mapped) are chunked by iter_day_chunks.
+    Parameters:
+        chunks (iterable): Yields chunks (u, udis, v, vdis) of original data, shape:(chunk_days, elem_n, nz)
+        xx0, yy0 (np.array): Coordinates of the original grid, shape: (elem,)
+        XX1, YY1 (np.array): Coordinates of the target grid, shape: (ny, nx)
+        lvls (int): Number of Levels in z-direction to analyze. Starting from lvl=0.
+        method (str): Interpolation method (nearest, linear, cubic)
+        grid_spacing (float): Grid_spacing of the interpolated rectangular (dx=dy) channel in degrees.
+        is_hw (bool): Whether to apply a Hanning Window before the Fourier Transformation (Defaults: False)
+        interp_boarders (bool): If NaN values on the edges are filled by nearest neighbours or cut out (Defaults: True)
+        n_workers (int): Number of worker processes for the method cubic (Defaults: None, i.e. serial)
+        accumulator (spectra.SpectrumAccumulator): Running statistics of the spectra, e.g. for confidence 
+            intervals (Defaults: None, i.e. a new one is used)
+        dtype (np.dtype): Data type of the interpolated fields, FFTs and energetics, e.g. np.float32 halves memory.
+            Collapsed spectra and energetics are summed up in float64 (Defaults: None, i.e. float64)
+    Returns:
+        ske_collapsed, sd_collapsed (np.array): Collapsed 2D-Spectra averaged over all days, shape:(k, nz)
+        states (np.array): Wavenumber vector containing all wavenumbers used in each iteration of collapsing process
+        ke, dis (np.array): Spatial Mean Kinetic Energy and dissipation in the interpolated channel averaged
+            over all days, shape:(nz,)
+    """
+    #- Modules
+    import numpy as np
+    from eddies.interpolation import interpolator, interpolation_tools
+    from eddies.diagnostics import spectra, energetics
+    
+    #- Parameters
+    plan = None
+    if method in interpolator.InterpolationPlan.methods:
+        plan = interpolator.InterpolationPlan(xx0, yy0, XX1, YY1, method) # Built once for all chunks
+    
+    if accumulator is None:
+        accumulator = spectra.SpectrumAccumulator()
+    
+    fill_plan     = None
+    box           = None
+    days          = 0
+    ke            = 0
+    dis           = 0
+    states        = None
+    
+    for chunk in chunks:
+        n_day = chunk[0].shape[0]
+        
+        #- Interpolation
+        if plan is not None:
+            fields = plan.apply(*chunk, lvls=lvls, dtype=dtype)
+        else:
+            fields = tuple(interpolator.interpolate_to_grid(q, xx0, yy0, XX1, YY1, n_day, lvls, method, n_workers=n_workers,
+                                                            dtype=dtype)
+                           for q in chunk)
+        
+        #- Boarders
+        if interp_boarders == True:
+            if fill_plan is None:
+                fill_plan = interpolation_tools.fill_plan(np.isnan(fields[0][0, :, :, 0])) # Derived once for all chunks
+            fields = tuple(interpolation_tools.fill_boarders(q, plan=fill_plan) for q in fields)
+        else:
+            if box is None:
+                box = interpolation_tools.nan_free_box(np.isnan(fields[0][0, :, :, 0])) # Derived once for all chunks
+            fields = tuple(interpolation_tools.cut_boarders(q, box=box) for q in fields)
+        ui, udisi, vi, vdisi = fields
+        
+        #- Total energetics
+        ke_chunk, dis_chunk = energetics.total_energetics_interp(ui, udisi, vi, vdisi, grid_spacing, dtype=dtype)
+        ke  = ke + ke_chunk * n_day
+        dis = dis + dis_chunk * n_day
+        
+        #- Spectra, Hanning Window in zonal and meridional direction applied in the FFT buffer
+        taper = 'hann' if is_hw == True else None
+        ske, sd, states = spectra.get_2D_spectrum(ui, vi, udisi, vdisi, taper=taper, dtype=dtype)
+        accumulator.update(ske, sd)
+        
+        days = days + n_day
+        del fields, ui, udisi, vi, vdisi, ske, sd
+    
+    #- Exceptions
+    assert days > 0, 'No data to process'
+    
+    ske_collapsed, sd_collapsed = accumulator.mean
+    
+    return (ske_collapsed, sd_collapsed, states, ke / days, dis / days)
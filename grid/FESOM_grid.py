@@ -1,70 +1,344 @@
 # Contains all variables used within the FESOM-Mesh
-# Import standard python packages
-# Sys
-import sys
-#---
-# Append system paths to FESOM MESH here
-#---
-                
-# Data import
-from netCDF4 import Dataset, MFDataset
-                
-# Data storage
-import collections
-import pandas as pd
-                
-# Math & Stats
-import numpy as np
-import math
-import scipy as sc
-import scipy.stats as stats
-from scipy.io import netcdf
-from scipy.interpolate import griddata
-import random
-                
-# Plotting data
-import matplotlib
-import matplotlib.pylab as plt
-import matplotlib.pyplot as plotter
-from matplotlib.backends.backend_pdf import PdfPages
-import colormap
-import seawater as sw
-from mpl_toolkits.basemap import Basemap
+# The mesh is loaded lazily by a Mesh object the first time one of its variables is used, 
+# such that importing this module is cheap.
+import functools
 
 #---
-# Some more FESOM Mesh modules
+# Set the path to the mesh and to the original data
 #---
+meshpath    = None # your_mesh_path
+result_path = None # path_to_original_data
+cache_dir   = None # Directory of the on-disk mesh cache, optional
 
-# Hack to fix missing PROJ4 env var
-import os
-import conda
-conda_file_dir = conda.__file__
-conda_dir = conda_file_dir.split('lib')[0]
-proj_lib = os.path.join(os.path.join(conda_dir, 'share'), 'proj')
-os.environ["PROJ_LIB"] = proj_lib
+class Mesh:
+    """
+    Description:
+        FESOM-Mesh with lazily computed and cached variables. The mesh files are only read when a variable
+        is used for the first time. A mesh can also be created from node coordinates and elements directly 
+        (see Mesh.from_arrays).
+        
+        Example:
+        mesh = Mesh(meshpath)
+        dis  = energetics.total_dis_orig(u, udis, v, vdis, mesh=mesh)
+    Parameters:
+        meshpath (str): Path to the FESOM mesh files
+        cyclic_length (float): Zonal length of a periodic channel. Elements wrapping around the channel are 
+            shifted by it to compute their centroids and areas (Defaults: None, i.e. no wrapping)
+        left_boundary, right_boundary (np.array): Indices of elements at the left and right boundary of the 
+            channel (Defaults: None, i.e. the elements with the smallest and largest x-coordinate in 
+            each row of centroids)
+        loader (callable): Function loading the mesh from meshpath, returns an object with node coordinates
+            x2, y2 and elements elem of shape:(elem_n, 3) (Defaults: None, i.e. pyfesom.load_mesh)
+        cache_dir (str): Directory of the on-disk mesh cache. Variables are stored as .npy files in a 
+            subdirectory named by a hash of the mesh source, and opened memory-mapped on later use, 
+            such that several processes share them (Defaults: None, i.e. no cache)
+    """
+    #- Variables stored in the mesh cache
+    cached = ('x2', 'y2', 'elem', 'elem_x', 'elem_y', 'elem_area', 'elem_weights', 'left_boundary', 'right_boundary', 
+              'elem_neighbours', 'elem_neighbours_bc', 'matrix_index')
+    
+    def __init__(self, meshpath=None, cyclic_length=None, left_boundary=None, right_boundary=None, loader=None, 
+                 cache_dir=None):
+        #- Modules
+        import numpy as np
+        
+        self.meshpath       = meshpath
+        self.cyclic_length  = cyclic_length
+        self.loader         = loader
+        self.cache_dir      = cache_dir
+        self._arrays        = {}
+        
+        if left_boundary is not None:
+            self._arrays['left_boundary'] = np.asarray(left_boundary)
+        if right_boundary is not None:
+            self._arrays['right_boundary'] = np.asarray(right_boundary)
+    
+    @classmethod
+    def from_arrays(cls, x2, y2, elem, **kwargs):
+        """
+        Description:
+            Creates a mesh from node coordinates and elements without reading mesh files.
+        Parameters:
+            x2, y2 (np.array): Coordinates of the nodes, shape:(node_n,)
+            elem (np.array): Nodes of the elements, shape:(3, elem_n)
+            kwargs: See Mesh
+        Returns:
+            mesh (Mesh)
+        """
+        #- Modules
+        import numpy as np
+        
+        mesh = cls(**kwargs)
+        mesh._arrays.update(x2=np.asarray(x2), y2=np.asarray(y2), elem=np.asarray(elem))
+        
+        return mesh
+    
+    @functools.cached_property
+    def fesom_mesh(self):
+        """FESOM mesh as loaded from meshpath"""
+        assert self.meshpath is not None, 'Set the path to the mesh'
+        
+        if self.loader is None:
+            import pyfesom as pf
+            return pf.load_mesh(self.meshpath)
+        
+        return self.loader(self.meshpath)
+    
+    def _get(self, name, compute):
+        """
+        Description:
+            Returns a cached variable of the mesh, computes it on first use.
+        Parameters:
+            name (str): Name of the variable
+            compute (callable): Computes the variable
+        Returns:
+            (np.array)
+        """
+        #- Modules
+        import os
+        import numpy as np
+        
+        if name not in self._arrays:
+            if self.cache_dir is None or name not in self.cached:
+                self._arrays[name] = compute()
+            else:
+                path = os.path.join(self.cache_path, name + '.npy')
+                if not os.path.exists(path):
+                    _save_atomic(path, compute())
+                self._arrays[name] = np.load(path, mmap_mode='r')
+        
+        return self._arrays[name]
+    
+    @functools.cached_property
+    def cache_path(self):
+        """
+        Description:
+            Directory of this mesh in the mesh cache, named by a hash of the mesh files (or node coordinates
+            and elements of a mesh from arrays), the cyclic length and given boundaries.
+        """
+        #- Modules
+        import os
+        import hashlib
+        import numpy as np
+        
+        key = hashlib.sha1()
+        if self.meshpath is not None:
+            files = [self.meshpath]
+            if os.path.isdir(self.meshpath):
+                files = [os.path.join(self.meshpath, f) for f in sorted(os.listdir(self.meshpath))]
+            for f in files:
+                if os.path.isfile(f):
+                    key.update(os.path.basename(f).encode())
+                    with open(f, 'rb') as source:
+                        for block in iter(lambda: source.read(2 ** 20), b''):
+                            key.update(block)
+        else:
+            for name in ('x2', 'y2', 'elem'):
+                key.update(np.ascontiguousarray(self._arrays[name]).tobytes())
+        
+        key.update(repr(self.cyclic_length).encode())
+        for name in ('left_boundary', 'right_boundary'):
+            if name in self._arrays and not isinstance(self._arrays[name], np.memmap):
+                key.update(name.encode() + np.ascontiguousarray(self._arrays[name]).tobytes())
+        
+        return os.path.join(self.cache_dir, key.hexdigest())
+    
+    def build_cache(self):
+        """
+        Description:
+            Computes all cached variables of the mesh and stores them in the mesh cache, e.g. once before 
+            starting worker processes.
+        Returns:
+            cache_path (str): Directory of this mesh in the mesh cache
+        """
+        assert self.cache_dir is not None, 'Set the cache directory of the mesh'
+        
+        for name in self.cached:
+            getattr(self, name)
+        
+        return self.cache_path
+    
+    @property
+    def x2(self):
+        """Zonal coordinates of the nodes, shape:(node_n,)"""
+        #- Modules
+        import numpy as np
+        
+        return self._get('x2', lambda: np.asarray(self.fesom_mesh.x2))
+    
+    @property
+    def y2(self):
+        """Meridional coordinates of the nodes, shape:(node_n,)"""
+        #- Modules
+        import numpy as np
+        
+        return self._get('y2', lambda: np.asarray(self.fesom_mesh.y2))
+    
+    @property
+    def elem(self):
+        """Nodes of the elements, shape:(3, elem_n)"""
+        #- Modules
+        import numpy as np
+        
+        return self._get('elem', lambda: np.asarray(self.fesom_mesh.elem).T)
+    
+    @property
+    def elem_n(self):
+        """Number of elements"""
+        return self.elem.shape[1]
+    
+    @property
+    def _elem_nodes_x(self):
+        """Zonal coordinates of the nodes of each element, shifted for elements wrapping around the channel"""
+        #- Modules
+        import numpy as np
+        
+        x = self.x2[self.elem]
+        if self.cyclic_length is not None:
+            x0    = np.min(self.x2) # Western end of the channel, as in elem_x
+            wraps = np.ptp(x, axis=0) > self.cyclic_length / 2
+            x[:, wraps] = np.where(x[:, wraps] < x0 + self.cyclic_length / 2, 
+                                   x[:, wraps] + self.cyclic_length, 
+                                   x[:, wraps]
+                                  )
+            assert np.all(np.ptp(x[:, wraps], axis=0) <= self.cyclic_length / 2), 'Elements wrapping around the channel could not be unwrapped, check cyclic_length'
+        return x
+    
+    @property
+    def elem_x(self):
+        """Zonal coordinates of the centroids, shape:(elem_n,)"""
+        #- Modules
+        import numpy as np
+        
+        def compute():
+            x = np.mean(self._elem_nodes_x, axis=0)
+            if self.cyclic_length is not None:
+                x0 = np.min(self.x2)
+                x  = np.mod(x - x0, self.cyclic_length) + x0
+            return x
+        
+        return self._get('elem_x', compute)
+    
+    @property
+    def elem_y(self):
+        """Meridional coordinates of the centroids, shape:(elem_n,)"""
+        #- Modules
+        import numpy as np
+        
+        return self._get('elem_y', lambda: np.mean(self.y2[self.elem], axis=0))
+    
+    @property
+    def elem_area(self):
+        """Area of the elements in units of the node coordinates, shape:(elem_n,)"""
+        #- Modules
+        import numpy as np
+        
+        def compute():
+            x = self._elem_nodes_x
+            y = self.y2[self.elem]
+            return 0.5 * np.abs((x[1] - x[0]) * (y[2] - y[0]) - (x[2] - x[0]) * (y[1] - y[0]))
+        
+        return self._get('elem_area', compute)
+    
+    @property
+    def elem_weights(self):
+        """Area of the elements / Total area, shape:(elem_n,)"""
+        #- Modules
+        import numpy as np
+        
+        return self._get('elem_weights', lambda: self.elem_area / np.sum(self.elem_area))
+    
+    def _boundaries(self):
+        """Elements with the smallest and largest x-coordinate in each row of centroids"""
+        #- Modules
+        import numpy as np
+        
+        order     = np.lexsort((self.elem_x, self.elem_y))
+        y_sorted  = self.elem_y[order]
+        new_row   = np.concatenate(([True], y_sorted[1:] != y_sorted[:-1], [True]))
+        edges     = np.where(new_row)[0]
+        
+        return order[edges[:-1]], order[edges[1:] - 1]
+    
+    @property
+    def left_boundary(self):
+        """Indices of elements at the left boundary of the channel"""
+        return self._get('left_boundary', lambda: self._boundaries()[0])
+    
+    @property
+    def right_boundary(self):
+        """Indices of elements at the right boundary of the channel"""
+        return self._get('right_boundary', lambda: self._boundaries()[1])
+    
+    @property
+    def elem_neighbours(self):
+        """Neighbours of the elements including neighbours wrapping around the channel, shape:(3, elem_n)"""
+        return self._get('elem_neighbours', lambda: _elem_neighbours(self.elem))
+    
+    @property
+    def elem_neighbours_bc(self):
+        """Neighbours of the elements excluding neighbours wrapping around the channel, shape:(3, elem_n)"""
+        return self._get('elem_neighbours_bc', 
+                         lambda: _elem_neighbours(self.elem, self.left_boundary, self.right_boundary)
+                        )
+    
+    @property
+    def matrix_index(self):
+        """Index of the elements in matrix-form as used by grid_transformer.elem_to_matrix, shape:(ny, nx)"""
+        def compute():
+            from eddies.grid import grid_transformer
+            return grid_transformer.matrix_index(self.elem_y, self.elem_x)
+        
+        return self._get('matrix_index', compute)
 
-#---
-# Set the path to the mesh
-#---
-meshpath  = your_mesh_path
+def _save_atomic(path, a):
+    """
+    Description:
+        Saves an array as .npy file. The file is written under a temporary name and renamed, 
+        such that other processes never read a partially written file.
+    Parameters:
+        path (str): Filename ending with .npy
+        a (np.array): Array to save
+    """
+    #- Modules
+    import os
+    import tempfile
+    import numpy as np
+    
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.npy')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, a)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
 
-#---
-# Load mesh
-#---
-#print("mesh will be loaded")
-mesh=load_mesh(meshpath)
+@functools.lru_cache(maxsize=None)
+def get_mesh():
+    """
+    Description:
+        Returns the mesh at meshpath. It is created once and shared by all callers.
+    Returns:
+        mesh (Mesh)
+    """
+    return Mesh(meshpath, cache_dir=cache_dir)
 
-# Upload mesh-variables
-result_path=path_to_original_data
+def __getattr__(name):
+    """
+    Description:
+        Gives access to variables of the mesh at meshpath as module variables, e.g. FESOM_grid.elem_area.
+        The mesh is only loaded on first access.
+    """
+    if name in ('elem', 'elem_n', 'elem_x', 'elem_y', 'elem_area', 'elem_weights', 'left_boundary', 'right_boundary'):
+        return getattr(get_mesh(), name)
+    if name == 'mesh':
+        return get_mesh().fesom_mesh
     
-#---
-# Usually here the FESOM mesh is loaded
-#---
+    raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
 
-# Create coordinates of centroids
-elem_x = x_centroid_coordinate
-elem_y = x_centroid_coordinate
-    
 def elem_neighbours():
     """
     Description:
@@ -76,40 +350,7 @@ def elem_neighbours():
         elem_neighbours (np.array), shape:(3,elem_n): Each centroid c contains of
         maximal 3 neighbours c'.
     """
-    el = elem # Nodes of centroids
-    el_n = elem_n
-    elem_neighbours = np.zeros(shape=(3,el_n))
-    
-    for c in range(el_n):
-        # Initialize
-        nodes_c = el[:,c] # Nodes of specific centroid
-        
-        # Sets with same nodes as cell c
-        A = np.where(el == nodes_c[0])[1] 
-        B = np.where(el == nodes_c[1])[1]
-        C = np.where(el == nodes_c[2])[1]
-        
-        # Intersection gives neighbouring cells c' of c, 
-        # Setdiff subtracts c of this s
-        n1 = np.setdiff1d(np.intersect1d(A,B), c)
-        n2 = np.setdiff1d(np.intersect1d(A,C), c)
-        n3 = np.setdiff1d(np.intersect1d(B,C), c)
-        
-        # Put all neighbour cells c' in one set
-        neighbours = np.union1d(np.union1d(n1,n2), n3)
-        neighbours = neighbours.astype('float')
-        
-        # Save neighbours to shape=(3,) array for saving to elem_neighbours
-        neighbour = np.zeros(shape=3, dtype='float')
-        neighbour[:] = np.nan
-        index = 0
-        for n in neighbours:
-            neighbour[index] = n
-            index = index + 1
-        
-        elem_neighbours[:, c] = neighbour
-    
-    return elem_neighbours   
+    return get_mesh().elem_neighbours
 
 def elem_neighbours_bc():
     """
@@ -122,52 +363,68 @@ def elem_neighbours_bc():
         elem_neighbours (np.array), shape:(3,elem_n), Each centroid c contains of
         maximal 3 neighbours c'.
     """
-    el = elem # Nodes of centroids
-    el_n = elem_n
-    elem_neighbours = np.zeros(shape=(3,el_n))
-    
-    for c in range(el_n):
-        # Initialize
-        nodes_c = el[:,c] # Nodes of specific centroid
-        
-        # Sets with same nodes as cell c
-        A = np.where(el == nodes_c[0])[1] 
-        B = np.where(el == nodes_c[1])[1]
-        C = np.where(el == nodes_c[2])[1]
-        
-        # Intersection gives neighbouring cells c' of c, 
-        # Setdiff subtracts c of this s
-        n1 = np.setdiff1d(np.intersect1d(A,B), c)
-        n2 = np.setdiff1d(np.intersect1d(A,C), c)
-        n3 = np.setdiff1d(np.intersect1d(B,C), c)
-        
-        # Put all neighbour cells c' in one set
-        neighbours = np.union1d(np.union1d(n1,n2), n3)
-        neighbours = neighbours.astype('float')
-        
-        # Left boundary
-        if c in left_boundary:
-            index = 0
-            for n in neighbours:
-                if n in right_boundary:
-                    neighbours[index] = np.nan # If a neighbour wraps around, set to NaN
-                index = index + 1
-        # Right boundary        
-        if c in right_boundary:
-            index = 0
-            for n in neighbours:
-                if n in left_boundary:
-                    neighbours[index] = np.nan
-                index = index + 1
-        
-        # Save neighbours to shape=(3,) array for saving to elem_neighbours
-        neighbour = np.zeros(shape=3, dtype='float')
-        neighbour[:] = np.nan
-        index = 0
-        for n in neighbours:
-            neighbour[index] = n
-            index = index + 1
-        
-        elem_neighbours[:, c] = neighbour
-    
-    return elem_neighbours
\ No newline at end of file
+    return get_mesh().elem_neighbours_bc
+
+def _elem_neighbours(el, left_boundary=None, right_boundary=None):
+    """
+    Description:
+        Finds the neighbours of all elements at once by hashing their edges: The (min, max) node pairs of 
+        all edges are sorted, such that the two elements sharing an edge appear next to each other.
+        Neighbours of each element are sorted ascending and padded with NaN.
+        If boundaries are given, neighbours c' of an element c at the left boundary that lie at the right 
+        boundary (and vice versa) wrap around the channel and are set to NaN.
+    Parameters:
+        el (np.array): Nodes of the elements, shape:(3, elem_n)
+        left_boundary, right_boundary (np.array): Indices of elements at the left and right boundary
+            of the channel (Defaults: None, i.e. no boundary conditions)
+    Returns:
+        elem_neighbours (np.array), shape:(3,elem_n): Each centroid c contains of
+        maximal 3 neighbours c'.
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    el   = np.asarray(el)
+    el_n = el.shape[1]
+    
+    #- Edges of all elements as (min, max) node pairs
+    first  = np.concatenate((el[0], el[0], el[1]))
+    second = np.concatenate((el[1], el[2], el[2]))
+    lo     = np.minimum(first, second)
+    hi     = np.maximum(first, second)
+    owner  = np.tile(np.arange(el_n), 3)
+    
+    #- Elements sharing an edge are next to each other after sorting
+    order  = np.lexsort((hi, lo))
+    lo     = lo[order]
+    hi     = hi[order]
+    owner  = owner[order]
+    shared = np.where((lo[1:] == lo[:-1]) & (hi[1:] == hi[:-1]))[0]
+    
+    #- Pairs (c, c') in both directions, sorted by c and c'
+    a     = owner[shared].astype(np.int64)
+    b     = owner[shared + 1].astype(np.int64)
+    pairs = np.unique(np.concatenate((a * el_n + b, b * el_n + a))) # One integer key per pair
+    c     = pairs // el_n
+    n_idx = pairs % el_n
+    n     = n_idx.astype('float')
+    
+    #- Position of each neighbour c' within the neighbours of c
+    start = np.searchsorted(c, c)
+    index = np.arange(len(c)) - start
+    
+    #- Wrapping neighbours at the boundaries
+    if left_boundary is not None and right_boundary is not None:
+        is_left  = np.zeros(el_n, dtype=bool)
+        is_right = np.zeros(el_n, dtype=bool)
+        is_left[np.asarray(left_boundary, dtype=int)]   = True
+        is_right[np.asarray(right_boundary, dtype=int)] = True
+        
+        wraps    = (is_left[c] & is_right[n_idx]) | (is_right[c] & is_left[n_idx])
+        n[wraps] = np.nan # If a neighbour wraps around, set to NaN
+    
+    elem_neighbours = np.full(shape=(3,el_n), fill_value=np.nan)
+    elem_neighbours[index, c] = n
+    
+    return elem_neighbours
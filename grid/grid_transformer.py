@@ -1,33 +1,72 @@
-def elem_to_matrix(u, yy):
+def elem_to_matrix(u, yy, xx=None, index=None, out=None, dtype=None):
     """
     Description:
-        Transforms u-quantity given in element-structure to a matrix-structure consisting of 
-        nx, ny gridpoints in zonal and meridional-direction, respectively. 
+        Transforms u-quantity given in element-structure to a matrix-structure consisting of
+        nx, ny gridpoints in zonal and meridional-direction, respectively.
         All elements for one specific ny show triangles of same orientation (either up- or downwards).
         The counting of ny starts at the bottom of the channel, e.g. with the smallest y-value.
-    
+        The elements are gathered in a single pass by a precomputed index (see matrix_index),
+        which can be reused for all quantities on the same mesh (e.g. FESOM_grid.Mesh.matrix_index).
+        
         Note: The FESOM-Grid is built in a strange way. For documentation see ??.
     Parameters:
-        u (np.array): quantity on FESOM-grid, shape:(n_day, n_elem, n_lvl)
+        u (np.array): quantity on FESOM-grid, shape:(n_day, n_elem, n_lvl), can be memory-mapped
         yy (np.array): y-coordinates of quantity, shape:(n_elem,)
+        xx (np.array): x-coordinates of quantity, shape:(n_elem,). If given, elements are sorted
+            by x within each row, otherwise they keep their order (Defaults: None)
+        index (np.array): Precomputed index of the elements in matrix-form, shape:(ny, nx) (Defaults: None)
+        out (np.array): Array to write the result to, shape(n_day, ny, nx, n_lvl) (Defaults: None)
+        dtype (np.dtype): Data type of the result without out, e.g. np.float32 to keep single precision 
+            FESOM output (Defaults: None, i.e. float64)
     Returns:
-        u_grid (np.array): quantity in matrix-form, shape(n_day, ny, nx, n_lvl) 
+        u_grid (np.array): quantity in matrix-form, shape(n_day, ny, nx, n_lvl)
     """
     
     #- Modules
     import numpy as np
     
     #- Parameters
-    y_coord = np.unique(yy)
-    n_day   = u.shape[0]
-    n_elem  = u.shape[1]
-    n_lvl   = u.shape[2]
-    ny      = len(y_coord)
-    nx      = n_elem // ny #- amount of elements / amount of y-coordinates = amount of x-coordinates
-    u_grid  = np.zeros(shape=(n_day, ny, nx, n_lvl))
-    
-    #- Separate data by y-coordinate
-    for i, y in enumerate(y_coord):
-        u_grid[:, i, :, :] = u[:, np.where(yy == y)[0], :]
-                    
-    return u_grid
\ No newline at end of file
+    if index is None:
+        index = matrix_index(yy, xx)
+    
+    #- Gather elements row by row
+    if dtype is None:
+        dtype = np.float64
+    
+    if out is None:
+        return np.take(u, index, axis=1).astype(dtype, copy=False)
+    
+    if out.dtype == u.dtype:
+        np.take(u, index, axis=1, out=out)
+    else:
+        out[...] = np.take(u, index, axis=1)
+    
+    return out
+
+def matrix_index(yy, xx=None):
+    """
+    Description:
+        Index of the elements in matrix-form as used by elem_to_matrix. Row i holds the elements of the
+        i-th smallest y-coordinate, sorted by their x-coordinate if given or otherwise in their order.
+    Parameters:
+        yy (np.array): y-coordinates of the elements, shape:(n_elem,)
+        xx (np.array): x-coordinates of the elements, shape:(n_elem,) (Defaults: None)
+    Returns:
+        index (np.array): Element indices, shape:(ny, nx)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    if xx is None:
+        order = np.argsort(yy, kind='stable')
+    else:
+        order = np.lexsort((xx, yy))
+    n_elem = len(order)
+    ny     = len(np.unique(yy))
+    nx     = n_elem // ny #- amount of elements / amount of y-coordinates = amount of x-coordinates
+    
+    #- Exceptions
+    assert ny * nx == n_elem, 'Each y-coordinate must hold the same amount of elements'
+    
+    return order.reshape(ny, nx)
@@ -0,0 +1,118 @@
+def channel_mesh(nx, ny, dx=1.0, cache_dir=None):
+    """
+    Description:
+        Creates a synthetic FESOM-like periodic channel mesh, e.g. for benchmarks without the FESOM mesh files.
+        The nodes form ny+1 rows of nx nodes with a spacing of dx, every second row shifted by dx/2, such that
+        the elements are equilateral triangles. Each row of nodes holds nx upward and nx downward triangles,
+        so all elements of one row of centroids show the same orientation as expected by
+        grid_transformer.elem_to_matrix. The channel is periodic in zonal direction with a length of nx * dx.
+        The mesh has 2 * nx * ny elements.
+    Parameters:
+        nx (int): Number of nodes in zonal direction
+        ny (int): Number of rows of elements in meridional direction
+        dx (float): Spacing of the nodes (Defaults: 1.0)
+        cache_dir (str): Directory of the on-disk mesh cache (Defaults: None, i.e. no cache)
+    Returns:
+        mesh (FESOM_grid.Mesh): Mesh with cyclic_length = nx * dx
+    """
+    #- Modules
+    import numpy as np
+    from eddies.grid import FESOM_grid
+    
+    #- Exceptions
+    if nx < 3 or ny < 1:
+        raise ValueError('The channel needs at least 3 nodes in zonal direction and 1 row of elements')
+    
+    #- Nodes
+    h      = dx * np.sqrt(3) / 2 # Height of the triangles
+    jj, ii = np.meshgrid(np.arange(ny + 1), np.arange(nx), indexing='ij')
+    x2     = (ii * dx + (jj % 2) * dx / 2).ravel().astype(np.float64)
+    y2     = (jj * h).ravel().astype(np.float64)
+    
+    #- Elements, counterclockwise, nodes of the last column connect to the first one
+    jj, ii = np.meshgrid(np.arange(ny), np.arange(nx), indexing='ij')
+    ii     = ii.ravel()
+    jj     = jj.ravel()
+    even   = (jj % 2 == 0) # Rows of nodes not shifted
+    
+    def node(i, j):
+        return j * nx + i % nx
+    
+    up   = np.where(even, [node(ii, jj), node(ii + 1, jj), node(ii, jj + 1)],
+                          [node(ii, jj), node(ii + 1, jj), node(ii + 1, jj + 1)])
+    down = np.where(even, [node(ii + 1, jj), node(ii + 1, jj + 1), node(ii, jj + 1)],
+                          [node(ii, jj), node(ii + 1, jj + 1), node(ii, jj + 1)])
+    elem = np.concatenate((up, down), axis=1)
+    
+    return FESOM_grid.Mesh.from_arrays(x2, y2, elem, cyclic_length=nx * dx, cache_dir=cache_dir)
+
+def channel_mesh_of_size(n_elem, aspect=2.0, dx=1.0, cache_dir=None):
+    """
+    Description:
+        Creates a synthetic channel mesh (see channel_mesh) with about n_elem elements.
+    Parameters:
+        n_elem (int): Approximate number of elements
+        aspect (float): Ratio of zonal to meridional length of the channel (Defaults: 2.0)
+        dx (float): Spacing of the nodes (Defaults: 1.0)
+        cache_dir (str): Directory of the on-disk mesh cache (Defaults: None, i.e. no cache)
+    Returns:
+        mesh (FESOM_grid.Mesh)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    h  = np.sqrt(3) / 2 # Height of the triangles relative to dx
+    ny = max(1, int(round(np.sqrt(n_elem * h / (2 * aspect)))))
+    nx = max(3, int(round(n_elem / (2 * ny))))
+    
+    return channel_mesh(nx, ny, dx=dx, cache_dir=cache_dir)
+
+def synthetic_fields(mesh, days, nz, n_modes=8, noise=0.1, seed=0, dtype=None):
+    """
+    Description:
+        Synthetic velocities and dissipation tendencies on the elements of a mesh. The velocities are a sum of
+        random Fourier modes, periodic in zonal direction, plus white noise. The dissipation tendencies are
+        a viscous damping of the modes (viscosity times their Laplacian), such that the dissipation is negative.
+    Parameters:
+        mesh (FESOM_grid.Mesh): Mesh with cyclic_length, e.g. of channel_mesh
+        days (int): Number of days
+        nz (int): Number of levels
+        n_modes (int): Number of Fourier modes (Defaults: 8)
+        noise (float): Standard deviation of the white noise (Defaults: 0.1)
+        seed (int): Seed of the random number generator (Defaults: 0)
+        dtype (np.dtype): Data type of the fields (Defaults: None, i.e. float64)
+    Returns:
+        u, udis, v, vdis (np.array): shape:(days, elem_n, nz)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Parameters
+    if dtype is None:
+        dtype = np.float64
+    rng       = np.random.default_rng(seed)
+    x         = mesh.elem_x
+    y         = mesh.elem_y
+    lx        = mesh.cyclic_length
+    ly        = np.max(y) - np.min(y)
+    viscosity = 1e-3 * lx ** 2 / (2 * np.pi) ** 2 # Damping time of 1000 days of the gravest zonal mode
+    
+    def field():
+        q    = np.zeros(shape=(days, len(x), nz), dtype=dtype)
+        qdis = np.zeros(shape=(days, len(x), nz), dtype=dtype)
+        for _ in range(n_modes):
+            kx        = 2 * np.pi * rng.integers(1, 9) / lx # Periodic in zonal direction
+            ky        = np.pi * rng.integers(1, 9) / ly
+            phase     = rng.uniform(0, 2 * np.pi, size=(days, 1, nz))
+            amplitude = rng.standard_normal(size=(days, 1, nz)) / (kx ** 2 + ky ** 2) ** 0.5
+            mode      = amplitude * np.sin(kx * x[np.newaxis, :, np.newaxis] + phase) * np.cos(ky * y[np.newaxis, :, np.newaxis])
+            q        += mode.astype(dtype)
+            qdis     -= (viscosity * (kx ** 2 + ky ** 2) * mode).astype(dtype) # Laplacian of the mode
+        q += (noise * rng.standard_normal(size=q.shape)).astype(dtype)
+        return (q, qdis)
+    
+    u, udis = field()
+    v, vdis = field()
+    
+    return (u, udis, v, vdis)
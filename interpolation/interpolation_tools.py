@@ -1,7 +1,16 @@
+import logging
+from eddies.common import instrumentation
+
+#- Progress messages, silent unless enabled by logging (e.g. logging.basicConfig(level=logging.INFO))
+logger = logging.getLogger(__name__)
+
+@instrumentation.instrumented('window')
 def apply_hanning_window(u, axis):
     """
     Description:
         Applies a Hanning Window along the given axis of u
+        The window is cached per length (see fourier_tools.window_1D) and broadcast along axis,
+        the only allocation is the result. For both horizontal axes at once see fourier_tools.apply_taper.
     Parameters:
         u (np.array): Quantity in matrix form
         axis (int): Axis along which to apply hanning window 
@@ -10,148 +19,253 @@ def apply_hanning_window(u, axis):
     """
     #- Modules
     import numpy as np
-    from eddies.common import calculation_tools
+    from eddies.common import fourier_tools
     
     #- Hanning Window along given axis
     n_axis = u.shape[axis]
-    hw     = np.hanning(n_axis)
+    hw     = fourier_tools.window_1D(n_axis, 'hann')
+    shape  = [1] * np.ndim(u)
+    shape[axis] = n_axis
     
-    return(calculation_tools.mult_along_axis(u, hw, axis))
+    return(u * hw.reshape(shape))
 
-def cut_boarders(u_int):
+@instrumentation.instrumented('fill')
+def cut_boarders(u_int, box=None, return_box=False):
     """
     Description:
         Cuts the white boarders (NaN-values) of interpolated quantity u_int given in the 
-        channel until it does not contain any NaN values anymore.
+        channel, such that it does not contain any NaN values anymore.
+        The largest rectangle without NaN values is found once on the 2D-mask (see nan_free_box), the NaN values
+        being at the same coordinates for all days and levels, and u_int is cut by a single slice (a view).
+        The box can be reused for all quantities and chunks on the same grid.
     Parameters:
         u_int (np.array): interpolated data, shape(days, ny, nx, nz)
+        box (tuple): (bottom, top, left, right) slice bounds as returned by nan_free_box (Defaults: None, i.e. derived from u_int)
+        return_box (bool): Whether to return the box as well (Defaults: False)
     Returns:
-    u_int (np.array): interpolated data without NaN values, shape(days, bottom:-top, left:-right, nz)
+        u_int (np.array): interpolated data without NaN values, shape(days, bottom:top, left:right, nz)
+        box (tuple): (bottom, top, left, right), if return_box
     """
     #- Modules
     import numpy as np
     
     #- Parameters
-    bottom = 1
-    top    = 1
-    left   = 1
-    right   = 1
+    if box is None:
+        box = nan_free_box(np.isnan(u_int[0, :, :, 0])) # NaN values will be at same coordinates for all days and levels
+    bottom, top, left, right = box
     
     #- Cut boarders
-    while np.isnan(u_int).sum() != 0:
-        u_int  = u_int[:, bottom:-top, left:-right, :]
-        bottom = bottom + 1
-        top    = top + 1
-        left   = left + 1
-        right  = right + 1
-        
+    u_int = u_int[:, bottom:top, left:right, :]
+    
+    if return_box:
+        return (u_int, box)
+    
     return u_int
 
-def fill_boarders(u_int):
+def nan_free_box(mask):
+    """
+    Description:
+        Largest rectangle without NaN values of a 2D-mask. The margins can differ on each side.
+        For each row, the number of consecutive valued grid points above each column gives a histogram,
+        whose largest rectangle is found with a stack in a single pass over the columns.
+    Parameters:
+        mask (np.array): True for NaN values, shape(ny, nx)
+    Returns:
+        bottom, top, left, right (int): Slice bounds of the rectangle, i.e. mask[bottom:top, left:right] has no NaN values
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Exceptions
+    if mask.all():
+        raise ValueError('The mask has no valued grid points')
+    
+    #- Parameters
+    ny, nx  = mask.shape
+    heights = np.zeros(nx + 1, dtype=np.int64) # Valued grid points above each column, 0 at the end flushes the stack
+    best    = (0, 0, 0, 0, 0) # area, bottom, top, left, right
+    
+    for row in range(ny):
+        heights[:nx] = np.where(mask[row], 0, heights[:nx] + 1)
+        h            = heights.tolist()
+        stack        = [] # Columns of increasing heights
+        
+        for col in range(nx + 1):
+            start = col
+            while stack and h[stack[-1][1]] >= h[col]:
+                start, top_col = stack.pop()
+                area           = h[top_col] * (col - start)
+                if area > best[0]:
+                    best = (area, row + 1 - h[top_col], row + 1, start, col)
+            stack.append((start, col))
+    
+    return best[1:]
+
+@instrumentation.instrumented('fill')
+def fill_boarders(u_int, plan=None):
     """
     Description:
         Fills the white boarders (NaN-values) of interpolated quantity u_int given in the 
         channel with values of its nearest neighbours by broadcasting.
+        The NaN values are at the same coordinates for all days and levels, so the source of each filled
+        grid point is derived once from the 2D-mask (see fill_plan) and all days and levels are filled
+        in place by a single gather. The plan can be reused for all quantities and chunks on the same grid.
     Parameters:
         u_int (np.array): interpolated data, shape(days, ny, nx, nz)
+        plan (tuple): Fill plan of the NaN values of u_int as returned by fill_plan (Defaults: None, i.e. derived from u_int)
     Returns:
         u_int (np.array): interpolated data without NaN values, shape(days, ny, nx, nz) 
     """
     #- Modules
     import numpy as np
     
-    if np.sum(np.isnan(u_int)) == 0:
-        print('The quantity already has no NaN values')
-        return (u_int)
-    
-    else:
-        #- Setup
-        nans      = np.array(np.where(np.isnan(u_int[0,:,:,0])))  # NaN values will be at same coordinates for all days and levels
-        not_nans  = np.array(np.where(~np.isnan(u_int[0,:,:,0])))
-        ny_isnan  = nans[0,:] #- y-coordinates of NaN
-        nx_isnan  = nans[1,:]
-        ny_valued = not_nans[0,:] # y-coordinates of values
-        nx_valued = not_nans[1,:]
-        
-        #- Fill meridional boundaries except corners
-        x1 = np.min(nx_valued) # Zonal area that is used to fill NaN values
-        x2 = np.max(nx_valued)
+    if plan is None:
+        if np.sum(np.isnan(u_int)) == 0:
+            logger.info('The quantity already has no NaN values')
+            return (u_int)
         
-        #-- Fill Bottom
-        y1 = np.min(ny_isnan)
-        y2 = np.min(ny_valued)
-        
-        for i in range(y1, y2+1):
-            u_int[:, i, x1:x2, :] = u_int[:, y2, x1:x2, :]
-        
-        #-- Fill Top
-        y1 = np.max(ny_valued)
-        y2 = np.max(ny_isnan)
+        plan = fill_plan(np.isnan(u_int[0, :, :, 0])) # NaN values will be at same coordinates for all days and levels
+    
+    #- Fill all days and levels at once
+    dst_y, dst_x, src_y, src_x = plan
+    u_int[:, dst_y, dst_x, :]  = u_int[:, src_y, src_x, :]
+    
+    return u_int
+
+def fill_plan(mask):
+    """
+    Description:
+        Derives the fill of fill_boarders from the 2D-mask of NaN values: The fill is applied once to the
+        indices of the grid points, which gives the source grid point of each filled grid point.
+    Parameters:
+        mask (np.array): True for NaN values, shape(ny, nx)
+    Returns:
+        dst_y, dst_x (np.array): Coordinates of the filled grid points
+        src_y, src_x (np.array): Coordinates of the valued grid points they are filled with
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Fill the indices of the grid points
+    ny, nx = mask.shape
+    index  = np.arange(ny * nx, dtype=np.float64).reshape(1, ny, nx, 1)
+    index[0, mask, 0] = np.nan
+    if mask.any():
+        index = _fill_boarders_loops(index)
+    
+    #- Grid points that changed their value
+    index = index[0, :, :, 0].astype(np.int64).ravel()
+    dst   = np.flatnonzero(index != np.arange(ny * nx))
+    src   = index[dst]
+    
+    return (dst // nx, dst % nx, src // nx, src % nx)
+
+def _fill_boarders_loops(u_int):
+    """
+    Description:
+        Fills the boarders of u_int row by row and column by column, the corners until no NaN values are left.
+    Parameters:
+        u_int (np.array): interpolated data with NaN values, shape(days, ny, nx, nz)
+    Returns:
+        u_int (np.array): interpolated data without NaN values, shape(days, ny, nx, nz)
+    """
+    #- Modules
+    import numpy as np
+    
+    #- Setup
+    nans      = np.array(np.where(np.isnan(u_int[0,:,:,0])))  # NaN values will be at same coordinates for all days and levels
+    not_nans  = np.array(np.where(~np.isnan(u_int[0,:,:,0])))
+    ny_isnan  = nans[0,:] #- y-coordinates of NaN
+    nx_isnan  = nans[1,:]
+    ny_valued = not_nans[0,:] # y-coordinates of values
+    nx_valued = not_nans[1,:]
+    
+    #- Fill meridional boundaries except corners
+    x1 = np.min(nx_valued) # Zonal area that is used to fill NaN values
+    x2 = np.max(nx_valued)
+    
+    #-- Fill Bottom
+    y1 = np.min(ny_isnan)
+    y2 = np.min(ny_valued)
+    
+    for i in range(y1, y2+1):
+        u_int[:, i, x1:x2, :] = u_int[:, y2, x1:x2, :]
+    
+    #-- Fill Top
+    y1 = np.max(ny_valued)
+    y2 = np.max(ny_isnan)
+    
+    for i in range(y1, y2+1):
+        u_int[:, i, x1:x2, :] = u_int[:, y1, x1:x2, :]
+    
+    #- Fill zonal boundaries
+    y1 = np.min(ny_valued) # Meridional area that is used to fill NaN values
+    y2 = np.max(ny_valued)
+    
+    #-- Fill Left side
+    x1 = np.min(nx_isnan)
+    x2 = np.min(nx_valued)
+    
+    for i in range(x1, x2+1):
+        u_int[:, y1:y2, i, :] = u_int[:, y1:y2, x2, :]
+    
+    #-- Fill Right side
+    x1 = np.max(nx_valued)
+    x2 = np.max(nx_isnan)
+    
+    for i in range(x1, x2+1):
+        u_int[:, y1:y2, i, :] = u_int[:, y1:y2, x1,:]
+    
+    #- Fill the corners
+    bottom  = 0
+    top     = -1
+    
+    while np.sum(np.isnan(u_int)) != 0: 
         
-        for i in range(y1, y2+1):
-            u_int[:, i, x1:x2, :] = u_int[:, y1, x1:x2, :]
-          
-        #- Fill zonal boundaries
-        y1 = np.min(ny_valued) # Meridional area that is used to fill NaN values
-        y2 = np.max(ny_valued)
+        # Bottom left an right corners
+        nans     = np.where(np.isnan(u_int[0, bottom, :, 0]))[0] # access array by [0] 
+        not_nans = np.where(~np.isnan(u_int[0, bottom, :, 0]))[0]
+        left     = np.min(not_nans)
+        right    = np.max(np.where(not_nans))
         
-        #-- Fill Left side
-        x1 = np.min(nx_isnan)
-        x2 = np.min(nx_valued)
+        for i in nans:
+            if i < left:
+                u_int[:, bottom, i, :] = u_int[:, bottom, left, :] # Bottom left corner
+            elif i > right:
+                u_int[:, bottom, i, :] = u_int[:, bottom, right, :] # Bottom right corner
         
-        for i in range(x1, x2+1):
-            u_int[:, y1:y2, i, :] = u_int[:, y1:y2, x2, :]
-            
-        #-- Fill Right side
-        x1 = np.max(nx_valued)
-        x2 = np.max(nx_isnan)
+        bottom = bottom + 1
         
-        for i in range(x1, x2+1):
-            u_int[:, y1:y2, i, :] = u_int[:, y1:y2, x1,:]
+        # Top
+        nans     = np.where(np.isnan(u_int[0, top, :, 0]))[0]
+        not_nans = np.where(~np.isnan(u_int[0, top, :, 0]))[0] 
+        left     = np.min(not_nans)
+        right    = np.max(np.where(not_nans))
         
-        #- Fill the corners
-        bottom  = 0
-        top     = -1
+        for i in nans:
+            if i < left:
+                u_int[:, top, i, :] = u_int[:, top, left, :] # Top left corner
+            elif i > right:
+                u_int[:, top, i, :] = u_int[:, top, right, :] # Top right corner
         
-        while np.sum(np.isnan(u_int)) != 0: 
-            
-            # Bottom left an right corners
-            nans     = np.where(np.isnan(u_int[0, bottom, :, 0]))[0] # access array by [0] 
-            not_nans = np.where(~np.isnan(u_int[0, bottom, :, 0]))[0]
-            left     = np.min(not_nans)
-            right    = np.max(np.where(not_nans))
-            
-            for i in nans:
-                if i < left:
-                    u_int[:, bottom, i, :] = u_int[:, bottom, left, :] # Bottom left corner
-                elif i > right:
-                    u_int[:, bottom, i, :] = u_int[:, bottom, right, :] # Bottom right corner
-            
-            bottom = bottom + 1
-            
-            # Top
-            nans     = np.where(np.isnan(u_int[0, top, :, 0]))[0]
-            not_nans = np.where(~np.isnan(u_int[0, top, :, 0]))[0] 
-            left     = np.min(not_nans)
-            right    = np.max(np.where(not_nans))
-            
-            for i in nans:
-                if i < left:
-                    u_int[:, top, i, :] = u_int[:, top, left, :] # Top left corner
-                elif i > right:
-                    u_int[:, top, i, :] = u_int[:, top, right, :] # Top right corner
-                    
-            top = top - 1
-            
-        return u_int
+        top = top - 1
+    
+    return u_int
 
-def fill_boarders_NN(u_int):
+@instrumentation.instrumented('fill')
+def fill_boarders_NN(u_int, plan=None):
     """
     Description:
         Fills the white boarders (NaN-values) of interpolated quantity u_int given in the 
-        channel with values of its nearest neighbour. Uses scipy's NearestNDInterpolator.
+        channel with values of its nearest neighbour. 
+        If the NaN values are at the same coordinates for all days and levels, the nearest valued grid point of
+        each NaN value is found once on the 2D-mask (see fill_plan_NN) and all days and levels are filled in place
+        by a single gather. The mask is compared slice by slice, such that no temporary of the size of u_int is
+        needed; with a plan the comparison is skipped. Otherwise scipy's NearestNDInterpolator is used on all values
+        and a new array is returned.
     Parameters:
         u_int (np.array): interpolated data, shape(days, ny, nx, nz)
+        plan (tuple): Fill plan of the NaN values of u_int as returned by fill_plan_NN (Defaults: None, i.e. derived from u_int)
     Returns:
         u_int (np.array): interpolated data without NaN values, shape(days, ny, nx, nz) 
     """
@@ -159,8 +273,47 @@ def fill_boarders_NN(u_int):
     import numpy as np
     from scipy.interpolate import NearestNDInterpolator
     
-    mask = np.where(~np.isnan(u_int)) # select data to update interpolator
-    interp = NearestNDInterpolator(np.transpose(mask), u_int[mask]) # creates interpolator with valid data
-    u_int  = interp(*np.indices(u_int.shape)) # interpolate all NaN values by nearest neighbour
+    if plan is None:
+        mask    = np.isnan(u_int[0, :, :, 0])
+        uniform = all(np.array_equal(np.isnan(u_int[day, :, :, lvl]), mask) 
+                      for day in range(u_int.shape[0]) for lvl in range(u_int.shape[3]))
+        
+        if uniform:
+            plan = fill_plan_NN(mask)
+        else:
+            mask = np.where(~np.isnan(u_int)) # select data to update interpolator
+            interp = NearestNDInterpolator(np.transpose(mask), u_int[mask]) # creates interpolator with valid data
+            u_int  = interp(*np.indices(u_int.shape)) # interpolate all NaN values by nearest neighbour
+            
+            return u_int
+    
+    #- Fill all days and levels at once
+    dst_y, dst_x, src_y, src_x = plan
+    u_int[:, dst_y, dst_x, :]  = u_int[:, src_y, src_x, :]
+    
+    return u_int
+
+def fill_plan_NN(mask):
+    """
+    Description:
+        Nearest valued grid point of each NaN value of the 2D-mask by an euclidean distance transform.
+        Equidistant neighbours may be chosen differently than by NearestNDInterpolator.
+    Parameters:
+        mask (np.array): True for NaN values, shape(ny, nx)
+    Returns:
+        dst_y, dst_x (np.array): Coordinates of the NaN values
+        src_y, src_x (np.array): Coordinates of their nearest valued grid points
+    """
+    #- Modules
+    import numpy as np
+    from scipy import ndimage
+    
+    #- Exceptions
+    if mask.all():
+        raise ValueError('The mask has no valued grid points to fill with')
+    
+    #- Nearest valued grid point (False in mask) of each grid point
+    index        = ndimage.distance_transform_edt(mask, return_distances=False, return_indices=True)
+    dst_y, dst_x = np.nonzero(mask)
     
-    return u_int
\ No newline at end of file
+    return (dst_y, dst_x, index[0][mask], index[1][mask])
@@ -1,8 +1,17 @@
-def interpolate_to_grid(u, xx0, yy0, XX1, YY1, days, lvls, method):
+import logging
+from eddies.common import instrumentation
+
+#- Progress messages, silent unless enabled by logging (e.g. logging.basicConfig(level=logging.INFO))
+logger = logging.getLogger(__name__)
+
+@instrumentation.instrumented('interpolate')
+def interpolate_to_grid(u, xx0, yy0, XX1, YY1, days, lvls, method, plan=None, n_workers=None, dtype=None):
     """
     Description: 
         Interpolates u from a grid of xx0, yy0 coordinates to a target grid of XX1, YY1 coordinates
         using a specified method (nearest, linear, cubic).
+        The methods nearest and linear are applied to all days and levels at once by an InterpolationPlan,
+        the method cubic calls scipy's griddata for each day and level, optionally spread over a process pool.
     Parameters: 
         u (np.array): quantity to interpolate, shape:(days, elem, lvl)
         xx0, yy0 (np.array): Coordinates of the original grid, shape: (elem,)
@@ -10,20 +19,44 @@ def interpolate_to_grid(u, xx0, yy0, XX1, YY1, days, lvls, method):
         days (int): Last day to interpolate to starting from day=0
         lvls (int): Number of Levels in z-direction to analyze. Starting from lvl=0.
         method (str): Interpolation method (nearest, linear, cubic)
+        plan (InterpolationPlan): Precomputed plan from xx0, yy0 to XX1, YY1 to reuse for several 
+            quantities (Defaults: None, i.e. a plan is built for the methods nearest and linear)
+        n_workers (int): Number of worker processes interpolating (day, lvl)-slices with the method cubic
+            (Defaults: None, i.e. serial)
+        dtype (np.dtype): Data type of the interpolated quantity, e.g. np.float32 (Defaults: None, i.e. float64)
     Returns:
-        u_interp (np.array): Interpolated quantity at target grid, shape:(day, ny, nx)
+        u_interp (np.array): Interpolated quantity at target grid, shape:(day, ny, nx, lvl)
     """
     #- Modules
     from scipy.interpolate import griddata
     import numpy as np 
     
+    #- Precomputed interpolation
+    if plan is None and method in InterpolationPlan.methods:
+        plan = InterpolationPlan(xx0, yy0, XX1, YY1, method)
+    
+    if plan is not None:
+        assert plan.method == method, 'The plan was built for method ' + plan.method
+        logger.info('Starting interpolation')
+        u_interp = plan.apply(u, days=days, lvls=lvls, dtype=dtype)
+        logger.info('Ending interpolation')
+        
+        return u_interp
+    
+    if n_workers is not None:
+        logger.info('Starting interpolation')
+        u_interp = _interpolate_parallel(u, xx0, yy0, XX1, YY1, days, range(lvls), method, n_workers, dtype=dtype)
+        logger.info('Ending interpolation')
+        
+        return u_interp
+    
     #- Parameters
     ny = XX1.shape[0]
     nx = XX1.shape[1]
-    u_interp = np.zeros(shape=(days, ny, nx, lvls))
+    u_interp = np.zeros(shape=(days, ny, nx, lvls), dtype=dtype)
     
     #- Interpolation
-    print('Starting interpolation')
+    logger.info('Starting interpolation')
     for day in range(days):
         #print(f'Interpolate day {day + 1}')
         for lvl in range(lvls):
@@ -33,11 +66,12 @@ def interpolate_to_grid(u, xx0, yy0, XX1, YY1, days, lvls, method):
                                    xi=(XX1, YY1),
                                    method=method
                       )
-    print('Ending interpolation')
-        
+    logger.info('Ending interpolation')
+    
     return u_interp
 
-def interpolate_to_grid_at_lvl(u, xx0, yy0, XX1, YY1, days, lvl, method):
+@instrumentation.instrumented('interpolate')
+def interpolate_to_grid_at_lvl(u, xx0, yy0, XX1, YY1, days, lvl, method, n_workers=None, dtype=None):
     """
     Description: 
         Interpolates u at a certain level from a grid of xx0, yy0 coordinates to a 
@@ -49,6 +83,8 @@ def interpolate_to_grid_at_lvl(u, xx0, yy0, XX1, YY1, days, lvl, method):
         days (int): Last day to interpolate to starting from day=0
         lvl (int): Level in z-direction to analyze
         method (str): Interpolation method (nearest, linear, cubic)
+        n_workers (int): Number of worker processes interpolating the days (Defaults: None, i.e. serial)
+        dtype (np.dtype): Data type of the interpolated quantity, e.g. np.float32 (Defaults: None, i.e. float64)
     Returns:
         u_interp (np.array): Interpolated quantity at target grid, shape:(day, ny, nx)
     """
@@ -56,21 +92,253 @@ def interpolate_to_grid_at_lvl(u, xx0, yy0, XX1, YY1, days, lvl, method):
     from scipy.interpolate import griddata
     import numpy as np 
     
+    if n_workers is not None:
+        logger.info('Starting interpolation')
+        u_interp = _interpolate_parallel(u, xx0, yy0, XX1, YY1, days, [lvl], method, n_workers, dtype=dtype)
+        logger.info('Ending interpolation')
+        
+        return u_interp[..., 0]
+    
     #- Parameters
     ny = XX1.shape[0]
     nx = XX1.shape[1]
-    u_interp = np.zeros(shape=(days, ny, nx))
+    u_interp = np.zeros(shape=(days, ny, nx), dtype=dtype)
     
     #- Interpolation
-    print('Starting interpolation')
+    logger.info('Starting interpolation')
     for day in range(days):
-        print(f'Interpolate day {day + 1}')
+        logger.debug('Interpolate day %d', day + 1)
         u_interp[day,:,:] = griddata(points=(xx0, yy0), 
                                values=u[day, :, lvl], 
                                xi=(XX1, YY1),
                                method=method
                   )
-    print('Ending interpolation')
+    logger.info('Ending interpolation')
+    
+    return u_interp
+
+def _interpolate_parallel(u, xx0, yy0, XX1, YY1, days, lvls, method, n_workers, dtype=None):
+    """
+    Description:
+        Interpolates (day, lvl)-slices of u with scipy's griddata on a pool of worker processes.
+        The coordinates, the quantity and the result are placed in shared memory once, so workers only receive
+        the indices of their slices and write their results directly to the preallocated result array.
+    Parameters:
+        u (np.array): quantity to interpolate, shape:(days, elem, lvl)
+        xx0, yy0 (np.array): Coordinates of the original grid, shape: (elem,)
+        XX1, YY1 (np.array): Coordinates of the target grid, shape: (ny, nx)
+        days (int): Last day to interpolate to starting from day=0
+        lvls (list): Levels in z-direction to interpolate
+        method (str): Interpolation method (nearest, linear, cubic)
+        n_workers (int): Number of worker processes
+        dtype (np.dtype): Data type of the result (Defaults: None, i.e. float64)
+    Returns:
+        u_interp (np.array): Interpolated quantity at target grid, shape:(day, ny, nx, len(lvls))
+    """
+    #- Modules
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    
+    #- Parameters
+    lvls  = list(lvls)
+    ny    = XX1.shape[0]
+    nx    = XX1.shape[1]
+    tasks = [(day, i) for day in range(days) for i in range(len(lvls))]
+    size  = max(1, len(tasks) // (4 * n_workers)) # Several chunks per worker for load balancing
+    
+    #- Shared memory
+    arrays = {'xx0': np.asarray(xx0, dtype=np.float64),
+              'yy0': np.asarray(yy0, dtype=np.float64),
+              'XX1': np.asarray(XX1, dtype=np.float64),
+              'YY1': np.asarray(YY1, dtype=np.float64),
+              'u': np.asarray(u[:days])[:, :, lvls],
+              'u_interp': np.zeros(shape=(days, ny, nx, len(lvls)), dtype=dtype)
+             }
+    shms, specs = _share_arrays(arrays)
+    
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(specs,)) as executor:
+            chunks = [tasks[i:i + size] for i in range(0, len(tasks), size)]
+            for _ in executor.map(_interpolate_slices, chunks, [method] * len(chunks)):
+                pass
+        
+        name, shape, dtype = specs['u_interp']
+        u_interp = np.ndarray(shape, dtype=dtype, buffer=shms['u_interp'].buf).copy()
+    finally:
+        for shm in shms.values():
+            shm.close()
+            shm.unlink()
+    
+    return u_interp
+
+def _share_arrays(arrays):
+    """
+    Description:
+        Copies arrays to shared memory blocks.
+    Parameters:
+        arrays (dict): Arrays to share by their names
+    Returns:
+        shms (dict): SharedMemory blocks by name of the array
+        specs (dict): (shared memory name, shape, dtype) by name of the array, used to attach to the blocks
+    """
+    #- Modules
+    import numpy as np
+    from multiprocessing import shared_memory
+    
+    shms  = {}
+    specs = {}
+    for key, a in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        shms[key]  = shm
+        specs[key] = (shm.name, a.shape, a.dtype.str)
+    
+    return shms, specs
+
+#- Arrays in shared memory of a worker process, set by _init_worker
+_worker_arrays = {}
+
+def _init_worker(specs):
+    """
+    Description:
+        Attaches a worker process to the shared memory blocks created by _share_arrays.
+    Parameters:
+        specs (dict): (shared memory name, shape, dtype) by name of the array
+    """
+    #- Modules
+    import numpy as np
+    from multiprocessing import shared_memory
+    
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _worker_arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        _worker_arrays['_shm_' + key] = shm # Keep a reference as long as the worker lives
+
+def _interpolate_slices(tasks, method):
+    """
+    Description:
+        Interpolates (day, lvl)-slices of the shared quantity and writes them to the shared result array.
+    Parameters:
+        tasks (list): (day, lvl) indices of the slices
+        method (str): Interpolation method (nearest, linear, cubic)
+    """
+    #- Modules
+    from scipy.interpolate import griddata
+    
+    a = _worker_arrays
+    for day, lvl in tasks:
+        a['u_interp'][day, :, :, lvl] = griddata(points=(a['xx0'], a['yy0']), 
+                                                 values=a['u'][day, :, lvl], 
+                                                 xi=(a['XX1'], a['YY1']),
+                                                 method=method
+                                                )
+
+class InterpolationPlan:
+    """
+    Description:
+        Precomputed interpolation from a grid of xx0, yy0 coordinates to a target grid of XX1, YY1 coordinates.
+        The Delaunay triangulation of the original grid and the location of the target points within it are 
+        computed once and stored as a sparse weight matrix of shape (ny*nx, elem). Applying the plan to 
+        quantities of all days and levels is then a single sparse matrix product. 
+        Gives the same results as scipy's griddata for the methods nearest and linear 
+        (NaN outside of the convex hull of the original grid for linear).
+    Parameters:
+        xx0, yy0 (np.array): Coordinates of the original grid, shape: (elem,)
+        XX1, YY1 (np.array): Coordinates of the target grid, shape: (ny, nx)
+        method (str): Interpolation method (nearest, linear)
+        tri (scipy.spatial.Delaunay): Triangulation of xx0, yy0 to reuse for several target grids 
+            (Defaults: None, i.e. it is computed for linear)
+    Attributes:
+        weights (scipy.sparse.csr_matrix): Interpolation weights, shape:(ny*nx, elem)
+        shape (tuple): Shape of the target grid (ny, nx)
+    """
+    methods = ('nearest', 'linear')
+    
+    def __init__(self, xx0, yy0, XX1, YY1, method, tri=None):
+        #- Modules
+        import numpy as np
+        from scipy import sparse
+        
+        #- Exceptions
+        if method not in self.methods:
+            raise ValueError('InterpolationPlan supports the methods nearest and linear, not ' + str(method))
+        
+        #- Parameters
+        points = np.column_stack((np.ravel(xx0), np.ravel(yy0))).astype(np.float64)
+        xi     = np.column_stack((np.ravel(XX1), np.ravel(YY1))).astype(np.float64)
+        n_elem = points.shape[0]
+        n_xi   = xi.shape[0]
+        
+        #- Weights
+        if method == 'nearest':
+            from scipy.spatial import cKDTree
+            
+            _, index = cKDTree(points).query(xi) # Nearest original gridpoint of each target point
+            indptr   = np.arange(n_xi + 1)
+            data     = np.ones(n_xi)
+        
+        else:
+            from scipy.spatial import Delaunay
+            
+            if tri is None:
+                tri = Delaunay(points)
+            
+            simplex = tri.find_simplex(xi)
+            inside  = simplex >= 0
+            
+            #- Barycentric coordinates of target points within their triangle
+            transform = tri.transform[simplex]
+            c         = np.einsum('ijk,ik->ij', transform[:, :2, :], xi - transform[:, 2, :])
+            data      = np.column_stack((c, 1 - c.sum(axis=1)))
+            index     = tri.simplices[simplex]
+            
+            #- Points outside of the triangulation are NaN, as in griddata
+            data[~inside]  = np.nan
+            index[~inside] = 0
+            
+            data   = data.ravel()
+            index  = index.ravel()
+            indptr = np.arange(0, 3 * n_xi + 1, 3)
+        
+        self.method  = method
+        self.shape   = np.shape(XX1)
+        self.tri     = tri
+        self.weights = sparse.csr_matrix((data, index, indptr), shape=(n_xi, n_elem))
+    
+    @instrumentation.instrumented('interpolate')
+    def apply(self, *fields, days=None, lvls=None, dtype=None):
+        """
+        Description:
+            Interpolates one or several quantities of all days and levels at once.
+        Parameters:
+            fields (np.array): quantities to interpolate, shape:(days, elem, lvl)
+            days (int): Last day to interpolate to starting from day=0 (Defaults: None, i.e. all days)
+            lvls (int): Number of Levels in z-direction to analyze. Starting from lvl=0 (Defaults: None, i.e. all levels)
+            dtype (np.dtype): Data type of the interpolation, e.g. np.float32 halves memory and bandwidth 
+                (Defaults: None, i.e. float64)
+        Returns:
+            u_interp (np.array or tuple): Interpolated quantities at target grid, shape:(day, ny, nx, lvl) 
+                for each field
+        """
+        #- Modules
+        import numpy as np
+        
+        #- Stack all fields, days and levels as columns, shape:(elem, fields*days*lvl)
+        fields  = [np.asarray(u[:days, :, :lvls]) for u in fields]
+        n_field = len(fields)
+        n_day   = fields[0].shape[0]
+        n_lvl   = fields[0].shape[2]
+        values  = np.stack(fields, axis=0, dtype=dtype).transpose(2, 0, 1, 3).reshape(self.weights.shape[1], -1)
+        weights = self.weights
+        if dtype is not None:
+            weights = weights.astype(dtype)
+        
+        #- Interpolation
+        u_interp = weights @ values
+        u_interp = u_interp.reshape(self.shape + (n_field, n_day, n_lvl))
+        u_interp = np.ascontiguousarray(u_interp.transpose(2, 3, 0, 1, 4)) # shape:(field, day, ny, nx, lvl)
+        
+        if n_field == 1:
+            return u_interp[0]
         
-    return u_interp   
-    
\ No newline at end of file
+        return tuple(u_interp)
@@ -0,0 +1,165 @@
+#- Benchmarked stages, see _benchmark_stages
+stages = ('elem_neighbours', 'elem_to_matrix', 'interpolate_nearest', 'interpolate_linear', 'interpolate_cubic',
+          'fill_boarders', 'get_2D_spectrum', 'total_energetics_orig', 'total_energetics_interp')
+
+def run_benchmarks(sizes=(10_000, 100_000, 1_000_000), days=2, nz=2, repeat=3, names=None, folder=None):
+    """
+    Description:
+        Times the hot paths on synthetic periodic channel meshes (see synthetic_grid.channel_mesh) of several sizes,
+        so they can be measured without the FESOM mesh and data. Each stage is timed repeat times, the fastest
+        run is kept. With a folder, the results are saved as <commit>.json, such that regressions between
+        commits can be found by compare_benchmarks.
+        
+        Example:
+        results = benchmarks.run_benchmarks(sizes=(10_000, 100_000), folder='../resources/benchmarks/')
+        benchmarks.compare_benchmarks('../resources/benchmarks/1a2b3c4.json', results)
+    Parameters:
+        sizes (tuple): Approximate numbers of elements of the meshes (Defaults: (10_000, 100_000, 1_000_000))
+        days (int): Number of days of the synthetic fields (Defaults: 2)
+        nz (int): Number of levels of the synthetic fields (Defaults: 2)
+        repeat (int): Number of timed runs of each stage (Defaults: 3)
+        names (list): Stages to time, see stages (Defaults: None, i.e. all stages)
+        folder (str): Folder to save the results to (Defaults: None, i.e. not saved)
+    Returns:
+        results (dict): 'commit', 'date', 'versions' and 'timings', the fastest run in seconds by stage and size
+    """
+    #- Modules
+    import os
+    import sys
+    import json
+    import timeit
+    import datetime
+    import numpy as np
+    import scipy
+    
+    #- Parameters
+    if names is None:
+        names = stages
+    for name in names:
+        if name not in stages:
+            raise ValueError('Unknown stage ' + str(name) + ', use one of ' + ', '.join(stages))
+    
+    results = {'commit': _git_commit(),
+               'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'versions': {'python': sys.version.split()[0], 'numpy': np.__version__, 'scipy': scipy.__version__},
+               'days': days,
+               'nz': nz,
+               'timings': {name: {} for name in names}
+              }
+    
+    for size in sizes:
+        benchmarks = _benchmark_stages(size, days, nz)
+        for name in names:
+            setup, stmt = benchmarks[name]
+            times       = timeit.Timer(stmt, setup=setup).repeat(repeat=repeat, number=1)
+            results['timings'][name][str(size)] = min(times)
+            print('{:<25} {:>9} elements {:10.4f} s'.format(name, size, min(times)))
+    
+    #- Saving
+    if folder is not None:
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, results['commit'] + '.json')
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=1)
+        print('Benchmarks saved to {}'.format(filename))
+    
+    return results
+
+def compare_benchmarks(baseline, results, threshold=1.2):
+    """
+    Description:
+        Compares two benchmark runs of run_benchmarks and lists the stages that got slower.
+    Parameters:
+        baseline (dict or str): Results or filename of the results of the reference commit
+        results (dict or str): Results or filename of the results to check
+        threshold (float): Ratio of the timings from which a stage counts as regression (Defaults: 1.2)
+    Returns:
+        regressions (list): (stage, size, baseline time, time, ratio) of all regressions
+    """
+    #- Modules
+    import json
+    
+    def load(r):
+        if isinstance(r, str):
+            with open(r) as f:
+                return json.load(f)
+        return r
+    
+    baseline = load(baseline)
+    results  = load(results)
+    
+    regressions = []
+    for name, timings in results['timings'].items():
+        for size, time in timings.items():
+            reference = baseline['timings'].get(name, {}).get(size)
+            if reference is None:
+                continue
+            ratio = time / reference
+            print('{:<25} {:>9} elements {:10.4f} s -> {:10.4f} s ({:.2f}x)'.format(name, size, reference, time, ratio))
+            if ratio > threshold:
+                regressions.append((name, int(size), reference, time, ratio))
+    
+    return regressions
+
+def _benchmark_stages(size, days, nz):
+    """
+    Description:
+        Setup and statement of each stage for a synthetic mesh of about size elements. The data is created once,
+        each setup only copies what the stage modifies or caches.
+    Parameters:
+        size (int): Approximate number of elements
+        days, nz (int): Number of days and levels of the synthetic fields
+    Returns:
+        (dict): (setup, stmt) callables by stage
+    """
+    #- Modules
+    import numpy as np
+    from eddies.grid import FESOM_grid, grid_transformer, setup_grid, synthetic_grid
+    from eddies.interpolation import interpolator, interpolation_tools
+    from eddies.diagnostics import spectra, energetics
+    
+    #- Synthetic mesh, fields and target grid with about one grid point per two elements
+    mesh             = synthetic_grid.channel_mesh_of_size(size)
+    u, udis, v, vdis = synthetic_grid.synthetic_fields(mesh, days, nz)
+    xx0, yy0         = mesh.elem_x, mesh.elem_y
+    index            = mesh.matrix_index
+    lx               = mesh.cyclic_length
+    ly               = np.max(yy0)
+    dx               = np.sqrt(lx * ly / (mesh.elem_n / 2))
+    XX1, YY1         = setup_grid.regular_grid(lx, ly, dx, dx, 0, 0)
+    
+    #- Fields on the target grid with NaN boarders (linear)
+    grids = interpolator.InterpolationPlan(xx0, yy0, XX1, YY1, 'linear').apply(u, udis, v, vdis)
+    fill  = interpolation_tools.fill_boarders(grids[0].copy())
+    box   = interpolation_tools.nan_free_box(np.isnan(grids[0][0, :, :, 0]))
+    cut   = tuple(interpolation_tools.cut_boarders(q, box=box) for q in grids)
+    state = {}
+    
+    def interpolate(method):
+        return lambda: interpolator.interpolate_to_grid(u, xx0, yy0, XX1, YY1, days, nz, method)
+    
+    return {'elem_neighbours': (lambda: state.update(mesh=FESOM_grid.Mesh.from_arrays(mesh.x2, mesh.y2, mesh.elem)),
+                                lambda: state['mesh'].elem_neighbours),
+            'elem_to_matrix': (lambda: None, lambda: grid_transformer.elem_to_matrix(u, yy0, index=index)),
+            'interpolate_nearest': (lambda: None, interpolate('nearest')),
+            'interpolate_linear': (lambda: None, interpolate('linear')),
+            'interpolate_cubic': (lambda: None, interpolate('cubic')),
+            'fill_boarders': (lambda: state.update(u=grids[0].copy()),
+                              lambda: interpolation_tools.fill_boarders(state['u'])),
+            'get_2D_spectrum': (lambda: None, lambda: spectra.get_2D_spectrum(fill, fill, fill, fill)),
+            'total_energetics_orig': (lambda: None, lambda: energetics.total_energetics_orig(u, udis, v, vdis, mesh=mesh)),
+            'total_energetics_interp': (lambda: None, lambda: energetics.total_energetics_interp(*cut, dx)),
+           }
+
+def _git_commit():
+    """Short hash of the current git commit of the package, 'unknown' outside of a git repository"""
+    #- Modules
+    import os
+    import subprocess
+    
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
@@ -0,0 +1,317 @@
+from eddies.common import instrumentation
+
+def run_sweep(u, udis, v, vdis, xx0, yy0, lx, ly, grid_spacings, offsets, lvls, methods=('nearest', 'linear', 'cubic'),
+              windows=(False, True), fills=(True, False), lvl=0, mesh=None, store=None, scheme=None, year=None,
+              n_workers=None):
+    """
+    Description:
+        Runs the parameter study over grid spacings, starting values, interpolation methods, Hanning Window on/off
+        and filled/cut boarders and returns the energy ratios (ORIG / INTERPOLATED) for plotter.scatter_energy_ratios.
+        Work is shared between the combinations:
+        - One task per grid spacing and starting values builds the target grid once for all methods.
+        - The Delaunay triangulation of the original grid is built once per process and used by the methods
+          linear and cubic of all target grids.
+        - Each interpolation feeds the filled and cut boarders, the energetics and the spectra with and without
+          Hanning Window.
+        Tasks run on a process pool (n_workers). With a result store, the energetics and collapsed spectra of each
+        finished task are saved, so an interrupted sweep resumes with the missing tasks. Results are stored with
+        lx, ly, lvls, the number of days and a fingerprint of the content of the original data and coordinates
+        (hashed once per sweep), a sweep over other data or levels does not resume from them.
+        
+        Example:
+        u, udis, v, vdis = data_loader.load_original_data(path, year, model_run, levels=slice(0, lvls))
+        energy_ratios, spectra = sweep.run_sweep(u, udis, v, vdis, elem_x, elem_y, lx, ly, [0.09, 0.045, 0.01],
+                                                 [(0, 0), (0.03, 0.03)], lvls, store=store, scheme=scheme, year=year)
+        fig = plotter.scatter_energy_ratios(energy_ratios[True])
+    Parameters:
+        u, udis, v, vdis (np.array): Velocities and dissipation tendencies of the original grid, shape:(days, elem_n, nz)
+        xx0, yy0 (np.array): Coordinates of the original grid, shape: (elem_n,)
+        lx, ly (float): length of the target grids in zonal and meridional direction
+        grid_spacings (list): Grid spacings dx=dy of the target grids
+        offsets (list): Starting values (sx, sy) of the target grids
+        lvls (int): Number of Levels in z-direction to analyze. Starting from lvl=0.
+        methods (tuple): Interpolation methods (Defaults: ('nearest', 'linear', 'cubic'))
+        windows (tuple): Whether a Hanning Window is applied before the Fourier Transformation (Defaults: (False, True))
+        fills (tuple): Whether NaN values on the edges are filled by nearest neighbours or cut out (Defaults: (True, False))
+        lvl (int): Level of the energy ratios (Defaults: 0)
+        mesh (FESOM_grid.Mesh): Mesh of the original grid (Defaults: None, i.e. FESOM_grid.get_mesh())
+        store (result_store.ResultStore): Store to save results to and resume from (Defaults: None)
+        scheme (str): Backscatter scheme, used as parameter in the store (Defaults: None)
+        year (int): Year of the data, used as parameter in the store (Defaults: None)
+        n_workers (int): Number of worker processes (Defaults: None, i.e. serial)
+    Returns:
+        energy_ratios (dict): Energy ratios of data_manager.create_energyratios_dict by fills (True, False).
+            Ratios are ordered ['nearest', 'linear', 'cubic'] * len(offsets)
+        spectra (dict): (ske_collapsed, sd_collapsed, states) averaged over days by (dx, sx, sy, method, hw, filled)
+    """
+    #- Modules
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from eddies.data import data_manager
+    from eddies.diagnostics import energetics
+    from eddies.interpolation import interpolator
+    
+    #- Parameters
+    tasks   = [(dx, sx, sy) for dx in grid_spacings for (sx, sy) in offsets]
+    options = (lx, ly, lvls, tuple(methods), tuple(windows), tuple(fills))
+    results = {}
+    arrays  = {'xx0': np.asarray(xx0, dtype=np.float64),
+               'yy0': np.asarray(yy0, dtype=np.float64),
+               'u': np.asarray(u[:, :, :lvls]),
+               'udis': np.asarray(udis[:, :, :lvls]),
+               'v': np.asarray(v[:, :, :lvls]),
+               'vdis': np.asarray(vdis[:, :, :lvls])
+              }
+    
+    #- Resume finished tasks of the same data
+    todo = []
+    if store is not None:
+        data = {'days': u.shape[0], 'data': _data_fingerprint(arrays)} # Stored with the results
+    for task in tasks:
+        loaded = _load_task(store, scheme, year, task, options, data) if store is not None else None
+        if loaded is None:
+            todo.append(task)
+        else:
+            results[task] = loaded
+    
+    #- Run missing tasks
+    
+    if n_workers is None:
+        _sweep_arrays.update(arrays)
+        try:
+            for task in todo:
+                results[task] = _run_task(task, options)
+                if store is not None:
+                    _save_task(store, scheme, year, task, options, data, results[task])
+        finally:
+            _sweep_arrays.clear()
+    
+    elif len(todo) > 0:
+        shms, specs = interpolator._share_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_sweep, initargs=(specs,)) as executor:
+                futures = {executor.submit(_run_task, task, options): task for task in todo}
+                for future in as_completed(futures):
+                    task          = futures[future]
+                    results[task] = future.result()
+                    if store is not None:
+                        _save_task(store, scheme, year, task, options, data, results[task]) # Saved as soon as a task finishes
+        finally:
+            for shm in shms.values():
+                shm.close()
+                shm.unlink()
+    
+    #- Energy ratios ORIG / INTERPOLATED
+    ke_orig, dis_orig = energetics.total_energetics_orig(arrays['u'], arrays['udis'], arrays['v'], arrays['vdis'],
+                                                         mesh=mesh)
+    energy_ratios = {}
+    for filled in fills:
+        dictionaries = []
+        for dx in grid_spacings:
+            ke_ratios  = []
+            dis_ratios = []
+            for (sx, sy) in offsets:
+                energetics_task = results[(dx, sx, sy)]['energetics']
+                for method in methods:
+                    ke, dis = energetics_task[(method, filled)]
+                    ke_ratios.append(ke_orig[lvl] / ke[lvl])
+                    dis_ratios.append(dis_orig[lvl] / dis[lvl])
+            dictionaries.append(data_manager.create_gridspacing_dict(np.array(dis_ratios), np.array(ke_ratios)))
+        energy_ratios[filled] = data_manager.create_energyratios_dict(dictionaries, np.array(grid_spacings))
+    
+    spectra = {}
+    for (dx, sx, sy), result in results.items():
+        for (method, hw, filled), s in result['spectra'].items():
+            spectra[(dx, sx, sy, method, hw, filled)] = s
+    
+    return (energy_ratios, spectra)
+
+#- Original data of the sweep in the current process, set by run_sweep or _init_sweep
+_sweep_arrays = {}
+
+def _init_sweep(specs):
+    """
+    Description:
+        Attaches a worker process to the original data in shared memory (see interpolator._share_arrays).
+    Parameters:
+        specs (dict): (shared memory name, shape, dtype) by name of the array
+    """
+    #- Modules
+    from eddies.interpolation import interpolator
+    
+    interpolator._init_worker(specs)
+    _sweep_arrays.update(interpolator._worker_arrays)
+
+def _triangulation():
+    """
+    Description:
+        Delaunay triangulation of the original grid, built once per process and shared by all target grids.
+    Returns:
+        tri (scipy.spatial.Delaunay)
+    """
+    #- Modules
+    import numpy as np
+    from scipy.spatial import Delaunay
+    
+    if 'tri' not in _sweep_arrays:
+        points               = np.column_stack((_sweep_arrays['xx0'], _sweep_arrays['yy0']))
+        _sweep_arrays['tri'] = Delaunay(points)
+    
+    return _sweep_arrays['tri']
+
+@instrumentation.instrumented('interpolate')
+def _interpolate(XX1, YY1, method):
+    """
+    Description:
+        Interpolates u, udis, v, vdis of the sweep to a target grid. The methods nearest and linear use an
+        InterpolationPlan, the method cubic scipy's CloughTocher2DInterpolator (as griddata) for all days and
+        levels at once. linear and cubic reuse the triangulation of the original grid.
+    Parameters:
+        XX1, YY1 (np.array): Coordinates of the target grid, shape: (ny, nx)
+        method (str): Interpolation method (nearest, linear, cubic)
+    Returns:
+        u, udis, v, vdis (np.array): Interpolated quantities, shape:(days, ny, nx, nz)
+    """
+    #- Modules
+    import numpy as np
+    from scipy.interpolate import CloughTocher2DInterpolator
+    from eddies.interpolation import interpolator
+    
+    a      = _sweep_arrays
+    fields = tuple(a[name] for name in ('u', 'udis', 'v', 'vdis'))
+    
+    if method in interpolator.InterpolationPlan.methods:
+        tri  = _triangulation() if method == 'linear' else None
+        plan = interpolator.InterpolationPlan(a['xx0'], a['yy0'], XX1, YY1, method, tri=tri)
+        return plan.apply(*fields)
+    
+    if method == 'cubic':
+        days, n_elem, nz = fields[0].shape
+        values   = np.stack(fields, axis=0).transpose(2, 0, 1, 3).reshape(n_elem, -1) # shape:(elem, fields*days*nz)
+        u_interp = CloughTocher2DInterpolator(_triangulation(), values)(XX1, YY1) # shape:(ny, nx, fields*days*nz)
+        u_interp = u_interp.reshape(XX1.shape + (len(fields), days, nz)).transpose(2, 3, 0, 1, 4)
+        return tuple(np.ascontiguousarray(q) for q in u_interp)
+    
+    raise ValueError('Unknown interpolation method ' + str(method))
+
+def _run_task(task, options):
+    """
+    Description:
+        Interpolates the original data to the target grid of one grid spacing and starting values with all methods
+        and calculates the total energetics and collapsed spectra of all boarder and window options.
+    Parameters:
+        task (tuple): (dx, sx, sy) of the target grid
+        options (tuple): (lx, ly, lvls, methods, windows, fills) of the sweep
+    Returns:
+        (dict): 'energetics': (ke, dis) by (method, filled),
+            'spectra': (ske_collapsed, sd_collapsed, states) averaged over days by (method, hw, filled)
+    """
+    #- Modules
+    import numpy as np
+    from eddies.grid import setup_grid
+    from eddies.interpolation import interpolation_tools
+    from eddies.diagnostics import energetics, spectra
+    
+    #- Parameters
+    dx, sx, sy = task
+    lx, ly, lvls, methods, windows, fills = options
+    XX1, YY1   = setup_grid.regular_grid(lx, ly, dx, dx, sx, sy) # One target grid for all methods
+    result     = {'energetics': {}, 'spectra': {}}
+    
+    for method in methods:
+        interpolated = _interpolate(XX1, YY1, method)
+        
+        for filled in fills:
+            #- Boarders
+            if filled == True:
+                fill_plan = interpolation_tools.fill_plan(np.isnan(interpolated[0][0, :, :, 0])) # Once for all quantities
+                ui, udisi, vi, vdisi = (interpolation_tools.fill_boarders(q.copy(), plan=fill_plan) for q in interpolated)
+            else:
+                box = interpolation_tools.nan_free_box(np.isnan(interpolated[0][0, :, :, 0]))
+                ui, udisi, vi, vdisi = (interpolation_tools.cut_boarders(q, box=box) for q in interpolated)
+            
+            #- Total energetics, before windowing
+            result['energetics'][(method, filled)] = energetics.total_energetics_interp(ui, udisi, vi, vdisi, dx)
+            
+            for hw in windows:
+                #- Spectra, Hanning Window in zonal and meridional direction applied in the FFT buffer
+                taper = 'hann' if hw == True else None
+                ske, sd, states = spectra.get_2D_spectrum(ui, vi, udisi, vdisi, taper=taper)
+                result['spectra'][(method, hw, filled)] = (np.mean(ske, axis=0), np.mean(sd, axis=0), states)
+    
+    return result
+
+def _data_fingerprint(arrays):
+    """
+    Description:
+        Fingerprint of the content of the original data and coordinates of a sweep (see stage_cache._fingerprint).
+        Fields are hashed day by day, such that at most one day is copied at once.
+    Parameters:
+        arrays (dict): xx0, yy0, u, udis, v, vdis
+    Returns:
+        (str): SHA-1 hex digest
+    """
+    #- Modules
+    import hashlib
+    from eddies.data import stage_cache
+    
+    h = hashlib.sha1()
+    for name in sorted(arrays):
+        a = arrays[name]
+        h.update((name + str(a.shape) + str(a.dtype)).encode())
+        stage_cache._fingerprint(list(a) if a.ndim > 1 else a, h)
+    
+    return h.hexdigest()
+
+def _task_params(scheme, year, task, options, data, method, hw, filled):
+    """
+    Parameters of the results of a task in the result store, as used by data_saver, extended by the length of
+    the target grid, the number of levels, the number of days and the fingerprint of the data (see _data_fingerprint),
+    such that a sweep only resumes from results of the same setup
+    """
+    dx, sx, sy = task
+    lx, ly, lvls = options[:3]
+    
+    return dict(scheme=scheme, year=year, dx=dx, dy=dx, sx=sx, sy=sy, method=method, hw=hw, filled=filled,
+                lx=lx, ly=ly, lvls=lvls, days=data['days'], data=data['data'])
+
+def _save_task(store, scheme, year, task, options, data, result):
+    """
+    Description:
+        Saves the total energetics and collapsed spectra of a task to a result store. The energetics do not depend
+        on the window and are saved for each window option, as expected by data_loader.load_total_energetics_from_store.
+    """
+    for (method, hw, filled), (ske, sd, states) in result['spectra'].items():
+        params  = _task_params(scheme, year, task, options, data, method, hw, filled)
+        ke, dis = result['energetics'][(method, filled)]
+        store.save({'ke': ke, 'dis': dis}, quantity='total_energetics', **params)
+        store.save({'ke': ske, 'dis': sd, 'states': states}, quantity='collapsed_spectra', **params)
+
+def _load_task(store, scheme, year, task, options, data):
+    """
+    Description:
+        Loads the results of a task from a result store.
+    Returns:
+        (dict): Results as returned by _run_task, None if any of them is missing
+    """
+    #- Parameters
+    lx, ly, lvls, methods, windows, fills = options
+    result = {'energetics': {}, 'spectra': {}}
+    
+    for method in methods:
+        for filled in fills:
+            for hw in windows:
+                params = _task_params(scheme, year, task, options, data, method, hw, filled)
+                if not (store.exists(quantity='total_energetics', **params)
+                        and store.exists(quantity='collapsed_spectra', **params)):
+                    return None
+                
+                ke_dis = store.load(quantity='total_energetics', **params)
+                s      = store.load(quantity='collapsed_spectra', **params)
+                if 'states' not in s:
+                    return None
+                
+                result['energetics'][(method, filled)]  = (ke_dis['ke'], ke_dis['dis'])
+                result['spectra'][(method, hw, filled)] = (s['ke'], s['dis'], s['states'])
+    
+    return result